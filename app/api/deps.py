@@ -2,11 +2,11 @@ from collections.abc import AsyncGenerator
 from typing import Annotated
 from sqlmodel.ext.asyncio.session import AsyncSession
 from fastapi import Depends
-from app.core.db import engine
+from app.core.db import AsyncSessionLocal
 
 
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
-    async with AsyncSession(engine) as session:
+    async with AsyncSessionLocal() as session:
         yield session
 
 
@@ -1,6 +1,9 @@
 import uuid
-from fastapi import APIRouter, HTTPException
+from typing import Annotated
+from fastapi import APIRouter, HTTPException, Query
+from sqlalchemy import bindparam, insert
 from sqlmodel import select
+from uuid_utils.compat import uuid7
 from app.api.deps import SessionDep
 from app.apimodels import (
     CreatePersonInformation,
@@ -12,6 +15,24 @@ from app.dbmodels import Person, Scan
 
 router = APIRouter()
 
+SCANS_PAGE_SIZE = 50
+MAX_SCANS_PAGE_SIZE = 200
+
+CREATE_PERSON = insert(Person)
+GET_PERSON_BY_UUID = select(Person.uuid, Person.name, Person.height_cm).where(
+    Person.uuid == bindparam("person_uuid")
+)
+GET_PERSON_ID_BY_UUID = select(Person.id).where(Person.uuid == bindparam("person_uuid"))
+GET_SCANS_BY_PERSON_UUID = (
+    select(Scan.uuid, Scan.created_at)
+    .join(Person, Scan.person_id == Person.id)
+    .where(Person.uuid == bindparam("person_uuid"))
+    # the id breaks ties, so pages neither repeat nor skip scans created together
+    .order_by(Scan.created_at.desc(), Scan.id.desc())
+    .limit(bindparam("limit"))
+    .offset(bindparam("offset"))
+)
+
 
 @router.put("/information")
 async def create_person_information(
@@ -21,15 +42,18 @@ async def create_person_information(
     Create person with given information.
     """
 
-    person = Person(uuid=uuid.uuid4(), name=body.name, height_cm=body.height_cm)
-    session.add(person)
+    # a core insert skips the unit of work, the response only needs known values
+    person_uuid = uuid7()
+    await session.exec(
+        CREATE_PERSON,
+        params={"uuid": person_uuid, "name": body.name, "height_cm": body.height_cm},
+    )
     await session.commit()
-    await session.refresh(person)
 
     return PersonInformationResponse(
-        uuid=person.uuid,
-        name=person.name,
-        height_cm=person.height_cm,
+        uuid=person_uuid,
+        name=body.name,
+        height_cm=body.height_cm,
     )
 
 
@@ -41,7 +65,7 @@ async def get_person_information(
     Get person information.
     """
 
-    person = await session.exec(select(Person).where(Person.uuid == person_uuid))
+    person = await session.exec(GET_PERSON_BY_UUID, params={"person_uuid": person_uuid})
     person = person.first()
     if person is None:
         raise HTTPException(400, "person not found")
@@ -54,18 +78,31 @@ async def get_person_information(
 
 
 @router.get("/{person_uuid}/scans")
-async def get_scans(session: SessionDep, person_uuid: uuid.UUID) -> list[ScanResponse]:
+async def get_scans(
+    session: SessionDep,
+    person_uuid: uuid.UUID,
+    limit: Annotated[int, Query(ge=1, le=MAX_SCANS_PAGE_SIZE)] = SCANS_PAGE_SIZE,
+    offset: Annotated[int, Query(ge=0)] = 0,
+) -> list[ScanResponse]:
     """
-    Get all scans
+    Get a page of scans, newest first
     """
 
-    person = await session.exec(select(Person).where(Person.uuid == person_uuid))
-    person = person.first()
-    if person is None:
-        raise HTTPException(400, "person not found")
+    scans = await session.exec(
+        GET_SCANS_BY_PERSON_UUID,
+        params={"person_uuid": person_uuid, "limit": limit, "offset": offset},
+    )
+    scans = scans.all()
 
-    scans = await session.exec(select(Scan).where(Scan.person_id == person.id))
+    # an empty list is ambiguous, only then check if the person exists at all
+    if len(scans) == 0:
+        person_id = await session.exec(
+            GET_PERSON_ID_BY_UUID, params={"person_uuid": person_uuid}
+        )
+        if person_id.first() is None:
+            raise HTTPException(400, "person not found")
 
     return [
-        ScanResponse(scan_uuid=scan.uuid, created_at=scan.created_at) for scan in scans
+        ScanResponse(scan_uuid=scan_uuid, created_at=created_at)
+        for scan_uuid, created_at in scans
     ]
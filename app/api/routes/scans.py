@@ -2,15 +2,23 @@ import asyncio
 import datetime
 import logging
 
-from fastapi import APIRouter, Response, UploadFile
+from typing import Annotated
+from fastapi import APIRouter, Header, Response, UploadFile
+from fastapi.responses import RedirectResponse
 from fastapi.exceptions import HTTPException
+from sqlalchemy import Update, bindparam, literal, update
+from sqlalchemy.dialects.postgresql import Insert, insert
 from sqlmodel import select
-from app.core.analysis import run_analysis
+from sqlmodel.ext.asyncio.session import AsyncSession
+from uuid_utils.compat import uuid7
+from app.core.analysis import RESULT_CACHE_TTL_S, result_cache, run_analysis
+from app.core.background import spawn
+from app.core.cache import TTLCache
 from app.core.s3 import client, bucket_name
 import uuid
 
 from app.api.deps import SessionDep
-from app.core.serverless import call_serverless
+from app.core.serverless import call_limit, call_serverless
 from app.apimodels import (
     VIDEO_CONTENT_TYPE,
     CreateScan,
@@ -19,10 +27,312 @@ from app.apimodels import (
     UploadResponse,
     ResultResponse,
 )
-from app.dbmodels import Photo, Person, Scan, ScanResult, Status, Video
+from app.dbmodels import (
+    Photo,
+    PhotoResult,
+    Person,
+    Scan,
+    ScanResult,
+    Status,
+    Video,
+    VideoResult,
+)
 
 router = APIRouter()
 
+MEDIA_URL_EXPIRES = datetime.timedelta(minutes=5)
+# the redirect must not outlive the presigned URL it points to
+MEDIA_CACHE_CONTROL = "private, max-age=60"
+# uploads above this size are sent as multipart uploads, part by part
+UPLOAD_PART_BYTES = 10 * 1024 * 1024
+# parts of one multipart upload that are sent to S3 at the same time
+UPLOAD_PARALLEL_PARTS = 4
+# larger uploads are rejected before anything is sent to S3
+MAX_PHOTO_BYTES = 20 * 1024 * 1024
+MAX_VIDEO_BYTES = 500 * 1024 * 1024
+
+JPG_CONTENT_TYPES = frozenset({"image/jpg", "image/jpeg"})
+JPG_EXTENSIONS = (".jpg", ".jpeg")
+VIDEO_EXTENSIONS = (".mp4", ".mov")
+
+# fixed-shape statements are built once, requests only bind the parameters
+GET_SCAN_ID_BY_UUID = select(Scan.id).where(Scan.uuid == bindparam("scan_uuid"))
+GET_SCAN_RESULT_BY_UUID = select(Scan.result).where(Scan.uuid == bindparam("scan_uuid"))
+# resolves the person and inserts the scan in one round-trip, returns no row if
+# the person does not exist
+CREATE_SCAN = (
+    insert(Scan)
+    .from_select(
+        ["uuid", "person_id", "result", "created_at"],
+        select(
+            bindparam("scan_uuid", type_=Scan.uuid.type),
+            Person.id,
+            bindparam("result", type_=Scan.result.type),
+            bindparam("created_at", type_=Scan.created_at.type),
+        ).where(Person.uuid == bindparam("person_uuid")),
+    )
+    .returning(Scan.uuid)
+)
+
+
+def build_media_status_upsert(model: type[Photo] | type[Video]) -> Insert:
+    """
+    Build the statement that creates the photo or video row of a scan with status
+    new, or resets the status of an existing row.
+
+    Args:
+        model: Either Photo or Video.
+
+    Returns:
+        The statement, returning the ID of the row and taking the scan_uuid parameter.
+    """
+
+    statement = insert(model).from_select(
+        ["scan_id", "status"],
+        select(Scan.id, literal(Status.new, model.status.type)).where(
+            Scan.uuid == bindparam("scan_uuid")
+        ),
+    )
+    return statement.on_conflict_do_update(
+        index_elements=["scan_id"], set_={"status": statement.excluded.status}
+    ).returning(model.id)
+
+
+UPSERT_MEDIA_STATUS = {
+    Photo: build_media_status_upsert(Photo),
+    Video: build_media_status_upsert(Video),
+}
+
+
+def build_mark_media_done(model: type[Photo] | type[Video]) -> Update:
+    """
+    Build the statement that stores the processing result of the photo or video of
+    a scan and marks it as done.
+
+    Args:
+        model: Either Photo or Video.
+
+    Returns:
+        The statement, returning the ID of the row and taking the scan_uuid and
+        result parameters.
+    """
+
+    return (
+        update(model)
+        .where(
+            model.scan_id
+            == select(Scan.id)
+            .where(Scan.uuid == bindparam("scan_uuid"))
+            .scalar_subquery()
+        )
+        .values(status=Status.done, process_result=bindparam("result"))
+        .returning(model.id)
+    )
+
+
+MARK_MEDIA_DONE = {
+    Photo: build_mark_media_done(Photo),
+    Video: build_mark_media_done(Video),
+}
+
+# lets the client reuse a result for as long as the server would serve it cached
+RESULT_CACHE_CONTROL = f"private, max-age={RESULT_CACHE_TTL_S}"
+SCAN_ID_CACHE_TTL_S = 3600
+
+# scan uuid -> scan id, the mapping never changes once a scan exists
+scan_id_cache: TTLCache[uuid.UUID, int] = TTLCache(
+    maxsize=10_000, ttl_s=SCAN_ID_CACHE_TTL_S
+)
+
+
+async def get_scan_id(session: AsyncSession, scan_uuid: uuid.UUID) -> int | None:
+    """
+    Look up the ID of a scan, cached in-process after the first lookup.
+
+    Args:
+        session: The database session.
+        scan_uuid: The UUID of the scan.
+
+    Returns:
+        The ID of the scan, or None if it does not exist.
+    """
+
+    scan_id = scan_id_cache.get(scan_uuid)
+    if scan_id is not None:
+        return scan_id
+
+    res = await session.exec(GET_SCAN_ID_BY_UUID, params={"scan_uuid": scan_uuid})
+    scan_id = res.first()
+    # misses are not cached, the scan may still be created
+    if scan_id is not None:
+        scan_id_cache.set(scan_uuid, scan_id)
+    return scan_id
+
+
+async def get_media_redirect(
+    session: AsyncSession, scan_uuid: uuid.UUID, key: str
+) -> RedirectResponse:
+    """
+    Redirect to a short-lived presigned URL of a stored photo or video.
+
+    The client downloads the object from S3 directly, so its bytes never pass
+    through the API.
+
+    Args:
+        session: The database session.
+        scan_uuid: The UUID of the scan the media belongs to.
+        key: The object key in the bucket.
+
+    Returns:
+        The redirect to the object.
+    """
+
+    if await get_scan_id(session, scan_uuid) is None:
+        raise HTTPException(400, "scan not found")
+
+    try:
+        url = client.presigned_get_object(bucket_name, key, expires=MEDIA_URL_EXPIRES)
+    except Exception as e:
+        logging.error(e)
+        raise HTTPException(500, "could not download file")
+
+    return RedirectResponse(
+        url, status_code=307, headers={"Cache-Control": MEDIA_CACHE_CONTROL}
+    )
+
+
+async def upsert_media_status(
+    session: AsyncSession, model: type[Photo] | type[Video], scan_uuid: uuid.UUID
+) -> int | None:
+    """
+    Create the photo or video row of a scan, or reset its status to new if it exists.
+
+    The scan is resolved inside the same statement, so this is a single round-trip.
+    The change is not committed.
+
+    Args:
+        session: The database session.
+        model: Either Photo or Video.
+        scan_uuid: The UUID of the scan.
+
+    Returns:
+        The ID of the photo or video row, or None if the scan does not exist.
+    """
+
+    res = await session.exec(
+        UPSERT_MEDIA_STATUS[model], params={"scan_uuid": scan_uuid}
+    )
+    return res.scalar_one_or_none()
+
+
+async def mark_media_done(
+    session: AsyncSession,
+    model: type[Photo] | type[Video],
+    scan_uuid: uuid.UUID,
+    result: PhotoResult | VideoResult,
+) -> int | None:
+    """
+    Store the processing result of the photo or video of a scan and mark it as done.
+
+    The scan is resolved inside the same statement, so this is a single round-trip.
+    The change is not committed.
+
+    Args:
+        session: The database session.
+        model: Either Photo or Video.
+        scan_uuid: The UUID of the scan.
+        result: The result of the processing.
+
+    Returns:
+        The ID of the photo or video row, or None if the scan or its photo or
+        video does not exist.
+    """
+
+    res = await session.exec(
+        MARK_MEDIA_DONE[model], params={"scan_uuid": scan_uuid, "result": result}
+    )
+    return res.scalar_one_or_none()
+
+
+async def remove_upload(key: str) -> None:
+    """
+    Remove an uploaded object that is not referenced by any scan.
+
+    Failures are only logged, so they don't hide the error of the request.
+
+    Args:
+        key: The object key in the bucket.
+    """
+
+    try:
+        await asyncio.to_thread(client.remove_object, bucket_name, key)
+    except Exception:
+        logging.exception(f"could not remove orphaned object {key}")
+
+
+async def store_upload(
+    session: AsyncSession,
+    model: type[Photo] | type[Video],
+    scan_uuid: uuid.UUID,
+    key: str,
+    file: UploadFile,
+    content_type: str,
+) -> None:
+    """
+    Upload a file to S3 and mark the photo or video of the scan as new.
+
+    The S3 upload and the status upsert run concurrently, the upsert is only
+    committed once the upload succeeded. The file is sent in parts of
+    UPLOAD_PART_BYTES from a worker thread, so only a few parts are in memory.
+
+    Args:
+        session: The database session.
+        model: Either Photo or Video.
+        scan_uuid: The UUID of the scan.
+        key: The object key in the bucket.
+        file: The uploaded file.
+        content_type: The content type to store the object with.
+
+    Raises:
+        HTTPException: If the scan does not exist or the upload failed.
+    """
+
+    upload = asyncio.to_thread(
+        client.put_object,
+        bucket_name,
+        key,
+        data=file.file,
+        length=file.size or -1,
+        part_size=UPLOAD_PART_BYTES,
+        num_parallel_uploads=UPLOAD_PARALLEL_PARTS,
+        content_type=content_type,
+    )
+    upload_result, media_id = await asyncio.gather(
+        upload,
+        upsert_media_status(session, model, scan_uuid),
+        return_exceptions=True,
+    )
+
+    if isinstance(media_id, BaseException):
+        logging.error(media_id)
+        await session.rollback()
+        if not isinstance(upload_result, BaseException):
+            # without the status nothing refers to the uploaded object
+            await remove_upload(key)
+        raise HTTPException(500, "could not update status")
+
+    if isinstance(upload_result, BaseException):
+        logging.error(upload_result)
+        await session.rollback()
+        raise HTTPException(500, "could not upload file")
+
+    if media_id is None:
+        # don't keep objects of scans that don't exist
+        await remove_upload(key)
+        raise HTTPException(400, "scan not found")
+
+    await session.commit()
+
 
 @router.post("/")
 async def create_scan(session: SessionDep, body: CreateScan) -> CreateScanResponse:
@@ -30,21 +340,22 @@ async def create_scan(session: SessionDep, body: CreateScan) -> CreateScanRespon
     Create new scan
     """
 
-    person = await session.exec(select(Person).where(Person.uuid == body.person_uuid))
-    person = person.first()
-    if person is None:
+    scan_uuid = await session.exec(
+        CREATE_SCAN,
+        params={
+            "scan_uuid": uuid7(),
+            "person_uuid": body.person_uuid,
+            "result": {},
+            "created_at": datetime.datetime.now(),
+        },
+    )
+    scan_uuid = scan_uuid.scalar_one_or_none()
+    if scan_uuid is None:
         raise HTTPException(400, "person not found")
 
-    scan = Scan(
-        uuid=uuid.uuid4(), person_id=person.id, created_at=datetime.datetime.now()
-    )
-    session.add(scan)
     await session.commit()
 
-    await session.refresh(scan)
-    await session.refresh(person)
-
-    return CreateScanResponse(person_uuid=person.uuid, scan_uuid=scan.uuid)
+    return CreateScanResponse(person_uuid=body.person_uuid, scan_uuid=scan_uuid)
 
 
 @router.post("/{scan_uuid}/photos/body")
@@ -58,52 +369,32 @@ async def upload_body_photo(
     Returns true if the upload was successfull
     """
 
-    if not (
-        file.content_type == "image/jpg" or file.content_type == "image/jpeg"
-    ) or not (
-        (file.filename or "").endswith(".jpg")
-        or (file.filename or "").endswith(".jpeg")
+    filename = (file.filename or "").lower()
+    if file.content_type not in JPG_CONTENT_TYPES or not filename.endswith(
+        JPG_EXTENSIONS
     ):
         raise HTTPException(400, "must upload a photo in format jpg")
+    if file.size is not None and file.size > MAX_PHOTO_BYTES:
+        raise HTTPException(413, "photo is too large")
+    extension = filename.rpartition(".")[2]
 
-    scan = await session.exec(select(Scan).where(Scan.uuid == scan_uuid))
-    scan = scan.first()
-    if scan is None:
-        raise HTTPException(400, "scan not found")
-
-    try:
-        client.put_object(
-            bucket_name,
-            f"photos/body/{scan.uuid}.jpg",
-            data=file.file,
-            length=file.size or -1,
-            content_type="image/jpg",
-        )
-    except Exception as e:
-        logging.error(e)
-        raise HTTPException(500, "could not upload file")
-
-    res = await session.exec(select(Photo).where(Photo.scan_id == scan.id))
-    photo = res.first()
-    if photo is None:
-        photo = Photo(scan_id=scan.id, status=Status.new)
-    else:
-        photo.status = Status.new
-
-    session.add(photo)
-    await session.commit()
-
-    extension = (file.filename or "").split(".")[-1]
+    await store_upload(
+        session, Photo, scan_uuid, f"photos/body/{scan_uuid}.jpg", file, "image/jpg"
+    )
 
-    asyncio.create_task(
-        call_serverless(str(scan_uuid), process_type="photo", file_extension=extension)
+    spawn(
+        call_serverless(str(scan_uuid), process_type="photo", file_extension=extension),
+        name=f"serverless-photo-{scan_uuid}",
+        limit=call_limit,
     )
 
     return UploadResponse(successful=True)
 
 
 @router.get(
-    "/{scan_uuid}/photos/body.jpg", responses={200: {"content": {"image/jpg": {}}}}
+    "/{scan_uuid}/photos/body.jpg",
+    response_class=RedirectResponse,
+    responses={307: {"description": "Redirect to the photo in storage"}},
 )
 async def get_body_photo(
     session: SessionDep,
@@ -113,20 +404,7 @@ async def get_body_photo(
     Get photo of body.
     """
 
-    scan = await session.exec(select(Scan).where(Scan.uuid == scan_uuid))
-    scan = scan.first()
-    if scan is None:
-        raise HTTPException(400, "scan not found")
-
-    try:
-        file = client.get_object(
-            bucket_name,
-            f"photos/body/{scan.uuid}.jpg",
-        )
-        return Response(content=file.read(), media_type="image/jpg")
-    except Exception as e:
-        logging.error(e)
-        raise HTTPException(500, "could not download file")
+    return await get_media_redirect(session, scan_uuid, f"photos/body/{scan_uuid}.jpg")
 
 
 @router.post("/{scan_uuid}/videos/pedalling")
@@ -140,48 +418,37 @@ async def upload_pedalling_video(
     Returns true if the upload was successful.
     """
 
-    if not (file.content_type or "").startswith(VIDEO_CONTENT_TYPE) or not (
-        file.filename or ""
-    ).lower().endswith((".mp4", ".mov")):
+    filename = (file.filename or "").lower()
+    if not (file.content_type or "").startswith(
+        VIDEO_CONTENT_TYPE
+    ) or not filename.endswith(VIDEO_EXTENSIONS):
         raise HTTPException(400, "must upload a video in format mp4 or mov")
-    extension = (file.filename or "").split(".")[-1]
-
-    scan = await session.exec(select(Scan).where(Scan.uuid == scan_uuid))
-    scan = scan.first()
-    if scan is None:
-        raise HTTPException(400, "scan not found")
-
-    try:
-        client.put_object(
-            bucket_name,
-            f"videos/pedalling/{scan.uuid}.{extension}",
-            data=file.file,
-            length=file.size or -1,
-            content_type=VIDEO_CONTENT_TYPE,
-        )
-    except Exception as e:
-        logging.error(e)
-        raise HTTPException(500, "could not upload file")
-
-    res = await session.exec(select(Video).where(Video.scan_id == scan.id))
-    video = res.first()
-    if video is None:
-        video = Video(scan_id=scan.id, status=Status.new)
-    else:
-        video.status = Status.new
-
-    session.add(video)
-    await session.commit()
+    if file.size is not None and file.size > MAX_VIDEO_BYTES:
+        raise HTTPException(413, "video is too large")
+    extension = filename.rpartition(".")[2]
+
+    await store_upload(
+        session,
+        Video,
+        scan_uuid,
+        f"videos/pedalling/{scan_uuid}.{extension}",
+        file,
+        VIDEO_CONTENT_TYPE,
+    )
 
-    asyncio.create_task(
-        call_serverless(str(scan_uuid), process_type="video", file_extension=extension)
+    spawn(
+        call_serverless(str(scan_uuid), process_type="video", file_extension=extension),
+        name=f"serverless-video-{scan_uuid}",
+        limit=call_limit,
     )
 
     return UploadResponse(successful=True)
 
 
 @router.get(
-    "/{scan_uuid}/videos/pedalling.mp4", responses={200: {"content": {"video/mp4": {}}}}
+    "/{scan_uuid}/videos/pedalling.mp4",
+    response_class=RedirectResponse,
+    responses={307: {"description": "Redirect to the video in storage"}},
 )
 async def get_pedalling_video(
     session: SessionDep,
@@ -191,20 +458,9 @@ async def get_pedalling_video(
     Get video of pedalling.
     """
 
-    scan = await session.exec(select(Scan).where(Scan.uuid == scan_uuid))
-    scan = scan.first()
-    if scan is None:
-        raise HTTPException(400, "scan not found")
-
-    try:
-        file = client.get_object(
-            bucket_name,
-            f"videos/pedalling/{scan.uuid}.mp4",
-        )
-        return Response(content=file.read(), media_type=VIDEO_CONTENT_TYPE)
-    except Exception as e:
-        logging.error(e)
-        raise HTTPException(500, "could not download file")
+    return await get_media_redirect(
+        session, scan_uuid, f"videos/pedalling/{scan_uuid}.mp4"
+    )
 
 
 @router.post("/{scan_uuid}/callback", tags=["callback"])
@@ -217,57 +473,74 @@ async def process_body_photo_results(
     Change the status to processed and upload the results to postgres
     """
 
-    scan_id = await session.exec(select(Scan.id).where(Scan.uuid == scan_uuid))
-    scan_id = scan_id.first()
-    if scan_id is None:
-        raise Exception("could not find scan")
+    model = Photo if body.process_type == "photo" else Video
+    media_id = await mark_media_done(session, model, scan_uuid, body.result)
+    if media_id is None:
+        raise HTTPException(400, f"{body.process_type} not found")
 
-    if body.process_type == "photo":
-        photo = await session.exec(select(Photo).where(Photo.scan_id == scan_id))
-        photo = photo.first()
-        if photo is None:
-            raise Exception("could not find photo")
+    await session.commit()
 
-        photo.status = Status.done
-        photo.process_result = body.result
+    if body.process_type == "video":
+        spawn(run_analysis(scan_uuid), name=f"analysis-{scan_uuid}")
 
-        session.add(photo)
-    elif body.process_type == "video":
-        video = await session.exec(select(Video).where(Video.scan_id == scan_id))
-        video = video.first()
-        if video is None:
-            raise Exception("could not find video")
 
-        video.status = Status.done
-        video.process_result = body.result
+async def load_result(session: AsyncSession, scan_uuid: uuid.UUID) -> ResultResponse:
+    """
+    Load the result of a scan, served from a short-lived cache for polling clients.
 
-        session.add(video)
+    Args:
+        session: The database session.
+        scan_uuid: The UUID of the scan.
 
-    await session.commit()
+    Returns:
+        The result of the scan.
+    """
 
-    if body.process_type == "video":
-        asyncio.create_task(run_analysis(scan_uuid))
+    cached = result_cache.get(scan_uuid)
+    if cached is not None:
+        return cached
+
+    res = await session.exec(GET_SCAN_RESULT_BY_UUID, params={"scan_uuid": scan_uuid})
+    result: ScanResult | None = res.first()
+    if result is None or result == {}:
+        response = ResultResponse(done=False)
+    else:
+        response = ResultResponse(
+            done=True,
+            saddle_x_cm=result["saddle_x_cm"],
+            saddle_y_cm=result["saddle_y_cm"],
+        )
+
+    result_cache.set(scan_uuid, response)
+    return response
 
 
 @router.get("/{scan_uuid}/result")
 async def get_result(
     session: SessionDep,
     scan_uuid: uuid.UUID,
+    response: Response,
+    if_none_match: Annotated[str | None, Header()] = None,
 ) -> ResultResponse:
     """
     Args:
         session:
         scan_uuid:
+        response:
+        if_none_match: The ETag of the result the client already has.
 
     Returns:
         ResultResponse: containing a boolean if the scan is done and optionally the change parameters of the saddle
     """
 
-    res = await session.exec(select(Scan.result).where(Scan.uuid == scan_uuid))
-    result: ScanResult | None = res.first()
-    if result is None or result == {}:
-        return ResultResponse(done=False)
+    result = await load_result(session, scan_uuid)
+
+    headers = {
+        "ETag": f'W/"{result.done}-{result.saddle_x_cm}-{result.saddle_y_cm}"',
+        "Cache-Control": RESULT_CACHE_CONTROL,
+    }
+    if if_none_match == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
 
-    saddle_x = result["saddle_x_cm"]
-    saddle_y = result["saddle_y_cm"]
-    return ResultResponse(done=True, saddle_x_cm=saddle_x, saddle_y_cm=saddle_y)
+    response.headers.update(headers)
+    return result
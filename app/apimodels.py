@@ -1,8 +1,10 @@
-from typing import Any, Literal, Union, Optional
+from typing import Annotated, Literal, Union, Optional
 import uuid
 import datetime
 from pydantic import BaseModel, Field
 
+from app.dbmodels import PhotoResult, VideoResult
+
 VIDEO_CONTENT_TYPE = "video/"
 
 
@@ -38,9 +40,22 @@ class UploadResponse(BaseModel):
 type ProcessType = Union[Literal["photo"], Literal["video"]]
 
 
-class ProcessResults(BaseModel):
-    process_type: ProcessType
-    result: Any
+# the results are TypedDicts, pydantic validates them without building model
+# instances, so they can be stored as they are
+class PhotoProcessResults(BaseModel):
+    process_type: Literal["photo"]
+    result: PhotoResult
+
+
+class VideoProcessResults(BaseModel):
+    process_type: Literal["video"]
+    result: VideoResult
+
+
+ProcessResults = Annotated[
+    Union[PhotoProcessResults, VideoProcessResults],
+    Field(discriminator="process_type"),
+]
 
 
 class ResultResponse(BaseModel):
@@ -1,15 +1,21 @@
 import asyncio
-from icecream import ic
-from typing import TypedDict
+import datetime
+import logging
+import math
+from typing import NamedTuple, TypedDict
 import uuid
 import numpy as np
 
-
-from pydantic import BaseModel
+from sqlalchemy import and_, bindparam, exists, func, literal, or_, update
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import AsyncConnection
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.core.db import engine
+from app.apimodels import ResultResponse
+from app.core.background import spawn
+from app.core.cache import TTLCache
+from app.core.db import AsyncSessionLocal, engine
 from app.dbmodels import (
     FacingDirection,
     Frame,
@@ -43,24 +49,15 @@ class Joint(TypedDict):
     z: float
 
 
-class Point(BaseModel):
+# a plain tuple, the analysis math needs no validation or arrays per point
+class Point(NamedTuple):
     x: float
     y: float
 
-    def to_np(self) -> np.ndarray:
-        """
-        Convert the Point object to a NumPy array.
-        """
-
-        return np.array([self.x, self.y])
-
-
-def point_from_dict(d: Joint) -> Point:
-    return Point(x=d["x"], y=d["y"])
-
 
 CYCLING_KNEE_RANGE = (140, 150)
 BEST_CYCLING_KNEE_ANGLE = (CYCLING_KNEE_RANGE[0] + CYCLING_KNEE_RANGE[1]) / 2
+COS_BEST_CYCLING_KNEE_ANGLE = math.cos(math.radians(BEST_CYCLING_KNEE_ANGLE))
 
 SELECTORS: Selector = {
     "left": {
@@ -74,9 +71,46 @@ SELECTORS: Selector = {
         "HIP": 24,  # pose.PoseLandmark.RIGHT_HIP.value,
     },
 }
+# (ankle, knee, hip) joint indices per facing direction
+LEG_JOINTS: dict[FacingDirection, tuple[int, int, int]] = {
+    direction: (selector["ANKLE"], selector["KNEE"], selector["HIP"])
+    for direction, selector in SELECTORS.items()
+}
 
 TIMEOUT_AFTER_S = 120
-REFETCH_EVERY_S = 1
+# waiting is woken up by notifications, refetching only covers lost ones, e.g.
+# while the listening connection reconnects
+REFETCH_EVERY_S = 10
+# notified by the database with the scan id when a photo or video is done
+MEDIA_DONE_CHANNEL = "media_done"
+# analyses of older scans are not resumed on startup
+RESUME_ANALYSES_OF = datetime.timedelta(days=1)
+RESULT_CACHE_TTL_S = 2
+
+IS_MEDIA_DONE = select(
+    and_(
+        exists().where(
+            Photo.scan_id == bindparam("scan_id"), Photo.status == Status.done
+        ),
+        exists().where(
+            Video.scan_id == bindparam("scan_id"), Video.status == Status.done
+        ),
+    )
+)
+# released with the transaction, when the result is committed or the analysis fails
+TRY_LOCK_ANALYSIS = select(func.pg_try_advisory_xact_lock(bindparam("scan_id")))
+RELEASE_ANALYSIS_CLAIM = (
+    update(Scan)
+    .where(Scan.uuid == bindparam("scan_uuid"))
+    .values(analysis_resumed_at=None)
+)
+GET_ANALYSIS_INPUTS = (
+    select(Person, Photo.process_result, Video.process_result)
+    .join(Scan, Scan.person_id == Person.id)
+    .join(Photo, Photo.scan_id == Scan.id)
+    .join(Video, Video.scan_id == Scan.id)
+    .where(Scan.id == bindparam("scan_id"))
+)
 
 
 async def wait_until_both_ready(session: AsyncSession, scan_id: int) -> None:
@@ -95,131 +129,116 @@ async def wait_until_both_ready(session: AsyncSession, scan_id: int) -> None:
     await asyncio.wait_for(gathered, timeout=TIMEOUT_AFTER_S)
 
 
-async def wait_until_media_ready(session: AsyncSession, scan_id: int) -> None:
-    """
-    Wait until the photo and video processing is done.
-    """
+# absorbs clients polling for the result, invalidated when an analysis saves one
+result_cache: TTLCache[uuid.UUID, ResultResponse] = TTLCache(
+    maxsize=1024, ttl_s=RESULT_CACHE_TTL_S
+)
 
-    photo_status = await get_photo_status(session, scan_id)
-    video_status = await get_video_status(session, scan_id)
-    while photo_status != Status.done or video_status != Status.done:
-        ic("waiting for video and photo to be uploaded")
+# scan id -> events of the analyses waiting for its photo and video
+_media_done_waiters: dict[int, set[asyncio.Event]] = {}
+_listener: AsyncConnection | None = None
+_listener_lock = asyncio.Lock()
 
-        await asyncio.sleep(REFETCH_EVERY_S)
-        photo_status = await get_photo_status(session, scan_id)
-        video_status = await get_video_status(session, scan_id)
 
+def _on_media_done(connection, pid: int, channel: str, payload: str) -> None:
+    for event in _media_done_waiters.get(int(payload), ()):
+        event.set()
 
-async def get_video_status(session: AsyncSession, scan_id: int) -> Status | None:
-    """
-    Retrieve the status of a video associated with a scan.
 
-    Args:
-        session: The database session.
-        scan_id: The ID of the scan.
-
-    Returns:
-        The status of the video.
+async def listen_media_done() -> None:
+    """
+    Make sure a connection listens to MEDIA_DONE_CHANNEL, reconnecting if it was
+    lost. The connection is shared by all waiting analyses of the process.
     """
 
-    video_status = await session.exec(
-        select(Video.status).where(Video.scan_id == scan_id)
-    )
-    video_status = video_status.one()
+    global _listener
 
-    if video_status == None:
-        return None
+    async with _listener_lock:
+        if _listener is not None:
+            raw = await _listener.get_raw_connection()
+            if not raw.driver_connection.is_closed():
+                return
+            await _listener.invalidate()
 
-    return Status[video_status]
+        connection = await engine.connect()
+        raw = await connection.get_raw_connection()
+        await raw.driver_connection.add_listener(MEDIA_DONE_CHANNEL, _on_media_done)
+        _listener = connection
 
 
-async def get_photo_status(session: AsyncSession, scan_id: int) -> Status | None:
+async def wait_until_media_ready(session: AsyncSession, scan_id: int) -> None:
     """
-    Retrieve the status of a photo associated with a scan.
-
-    Args:
-        session: The database session.
-        scan_id: The ID of the scan.
+    Wait until the photo and video processing is done.
 
-    Returns:
-        The status of the photo.
+    The statuses are checked again whenever the database notifies that a photo or
+    video of the scan is done, or after REFETCH_EVERY_S at the latest.
     """
 
-    photo_status = await session.exec(
-        select(Photo.status).where(Photo.scan_id == scan_id)
-    )
-    photo_status = photo_status.first()
+    await listen_media_done()
 
-    if photo_status == None:
-        return None
+    event = asyncio.Event()
+    waiters = _media_done_waiters.setdefault(scan_id, set())
+    waiters.add(event)
+    try:
+        while True:
+            # cleared before checking, so a notification in between is not missed
+            event.clear()
+            if await is_media_done(session, scan_id):
+                return
 
-    return Status[photo_status]
+            try:
+                await asyncio.wait_for(event.wait(), timeout=REFETCH_EVERY_S)
+            except TimeoutError:
+                pass
+    finally:
+        waiters.discard(event)
+        if len(waiters) == 0 and _media_done_waiters.get(scan_id) is waiters:
+            del _media_done_waiters[scan_id]
 
 
-async def get_video_result(session: AsyncSession, scan_id: int) -> VideoResult:
+async def is_media_done(session: AsyncSession, scan_id: int) -> bool:
     """
-    Retrieve the video processing result for a specific scan.
+    Check if both the photo and video processing of a scan are done.
+
+    The database evaluates the check, only a single boolean is returned.
 
     Args:
         session: The database session.
         scan_id: The ID of the scan.
 
     Returns:
-        The video result.
-
-    Raises:
-        Exception: If no result is found.
+        True if both the photo and the video are done, otherwise False.
     """
 
-    res = await session.exec(
-        select(Video.process_result).where(Video.scan_id == scan_id)
-    )
-    result: VideoResult | None = res.first()
-    if result is None:
-        raise Exception(f"no result of video, scan_id: {scan_id}")
-
-    return result
+    res = await session.exec(IS_MEDIA_DONE, params={"scan_id": scan_id})
+    return res.one()
 
 
-async def get_photo_result(session: AsyncSession, scan_id: int) -> PhotoResult:
+async def get_analysis_inputs(
+    session: AsyncSession, scan_id: int
+) -> tuple[Person, PhotoResult, VideoResult]:
     """
-    Retrieve the photo processing result for a specific scan.
+    Retrieve the person and the photo and video results of a scan in one query.
 
     Args:
         session: The database session.
         scan_id: The ID of the scan.
 
     Returns:
-        The photo result.
+        The person, the photo result and the video result.
 
     Raises:
         Exception: If no result is found.
     """
 
-    res = await session.exec(
-        select(Photo.process_result).where(Photo.scan_id == scan_id)
-    )
-    result: PhotoResult | None = res.first()
-    if result is None:
+    res = await session.exec(GET_ANALYSIS_INPUTS, params={"scan_id": scan_id})
+    person, photo_result, video_result = res.one()
+    if photo_result is None:
         raise Exception(f"no result of photo, scan_id: {scan_id}")
+    if video_result is None:
+        raise Exception(f"no result of video, scan_id: {scan_id}")
 
-    return result
-
-
-async def get_person(session: AsyncSession, scan: Scan) -> Person:
-    """
-    Retrieve the person associated with a scan.
-
-    Args:
-        session: The database session.
-        scan: The Scan object.
-
-    Returns:
-        The Person object.
-    """
-
-    res = await session.exec(select(Person).where(Person.id == scan.person_id))
-    return res.one()
+    return person, photo_result, video_result
 
 
 async def get_scan(session: AsyncSession, scan_uuid: uuid.UUID) -> Scan:
@@ -268,25 +287,17 @@ def get_min_max_frames(
     Find the frames with the minimum and maximum knee angles.
 
     Args:
-        knee_angles: A list of knee angles.
+        frames: The frames of the video, must not be empty.
+        facing_direction: The direction the person is facing.
 
     Returns:
-        A tuple containing the indices of the frames with the minimum and maximum angles.
+        A tuple containing the frames with the minimum and maximum angles.
     """
 
-    min_angle = float("inf")
-    min_angle_index = -1
-    max_angle = -1.0
-    max_angle_index = -1
-    for i, frame in enumerate(frames):
-        angle = frame["knee_angle"]
-        if angle < min_angle:
-            min_angle = angle
-            min_angle_index = i
-        if angle > max_angle:
-            max_angle = angle
-            max_angle_index = i
-    return frames[min_angle_index], frames[max_angle_index]
+    knee_angles = np.fromiter(
+        (frame["knee_angle"] for frame in frames), dtype=np.float64, count=len(frames)
+    )
+    return frames[int(knee_angles.argmin())], frames[int(knee_angles.argmax())]
 
 
 def get_knee_values(
@@ -304,9 +315,14 @@ def get_knee_values(
         A tuple of three Points: ankle, knee, and hip.
     """
 
-    foot: Point = point_from_dict(joints[SELECTORS[facing_direction]["ANKLE"]])
-    knee: Point = point_from_dict(joints[SELECTORS[facing_direction]["KNEE"]])
-    hip: Point = point_from_dict(joints[SELECTORS[facing_direction]["HIP"]])
+    ankle_index, knee_index, hip_index = LEG_JOINTS[facing_direction]
+    ankle_joint = joints[ankle_index]
+    knee_joint = joints[knee_index]
+    hip_joint = joints[hip_index]
+
+    foot = Point(ankle_joint["x"], ankle_joint["y"])
+    knee = Point(knee_joint["x"], knee_joint["y"])
+    hip = Point(hip_joint["x"], hip_joint["y"])
 
     return (foot, knee, hip)
 
@@ -323,37 +339,36 @@ def distance_between(a: Point, b: Point) -> float:
         The distance between the two points.
     """
 
-    x_diff = abs(a.x - b.x)
-    y_diff = abs(a.y - b.y)
+    x_diff = a.x - b.x
+    y_diff = a.y - b.y
 
-    return np.sqrt(x_diff**2 + y_diff**2)
+    return math.sqrt(x_diff * x_diff + y_diff * y_diff)
 
 
-def get_angle(a: np.ndarray, b: np.ndarray, c: np.ndarray) -> int:
+def get_angle(a: Point, b: Point, c: Point) -> float:
     """
-    Uses the dot product to calculate the angle between three points.
+    Uses the cross and dot product to calculate the angle between three points.
+
+    Computed on plain floats, NumPy only adds overhead for two-element vectors.
+    atan2 needs neither the magnitudes nor clipping rounding errors into the domain
+    of arccos, and is accurate near 0 and 180 degrees.
+
     Args:
-        a: coordinates of the first point.
-        b: coordinates of the second point (where the angle is measured).
-        c: coordinates of the third point.
+        a: The first point.
+        b: The second point (where the angle is measured).
+        c: The third point.
 
     Returns:
         The calculated angle in degrees.
     """
 
-    v1 = a - b
-    v2 = c - b
-
-    dot_product = np.dot(v1, v2)
-    magnitude_v1 = np.linalg.norm(v1)
-    magnitude_v2 = np.linalg.norm(v2)
+    v1_x, v1_y = a.x - b.x, a.y - b.y
+    v2_x, v2_y = c.x - b.x, c.y - b.y
 
-    cosine_angle = dot_product / (magnitude_v1 * magnitude_v2)
-    cosine_angle = np.clip(cosine_angle, -1.0, 1.0)
+    cross_product = v1_x * v2_y - v1_y * v2_x
+    dot_product = v1_x * v2_x + v1_y * v2_y
 
-    angle = np.rad2deg(np.arccos(cosine_angle))
-
-    return angle
+    return math.degrees(abs(math.atan2(cross_product, dot_product)))
 
 
 def is_in_range(x: float, from_to: tuple[float, float]) -> bool:
@@ -371,23 +386,36 @@ def is_in_range(x: float, from_to: tuple[float, float]) -> bool:
     return from_to[0] <= x and x <= from_to[1]
 
 
-def unnormalize_frame(frame: Frame, width: int, height: int) -> Frame:
+def unnormalize_point(point: Point, width: int, height: int) -> Point:
     """
-    Unnormalize the frame given with given width and height.
+    Unnormalize the point with given width and height.
 
     Args:
-        frame: The frame to change.
+        point: The normalized point.
         width: The width to use for unnormalization.
         height: The height to use for unnormalization.
 
     Returns:
-        The new frame with the joints unnormalized.
+        The point in pixels.
+    """
+
+    return Point(point.x * width, point.y * height)
+
+
+async def save_result(session: AsyncSession, scan: Scan, result: ScanResult) -> None:
     """
-    for i, joint in enumerate(frame["joints"]):
-        frame["joints"][i]["x"] = joint["x"] * width
-        frame["joints"][i]["y"] = joint["y"] * height
+    Store the result of a scan and drop its cached response.
 
-    return frame
+    Args:
+        session: The database session.
+        scan: The analyzed scan.
+        result: The calculated result.
+    """
+
+    scan.result = result
+    session.add(scan)
+    await session.commit()
+    result_cache.invalidate(scan.uuid)
 
 
 async def run_analysis(scan_uuid: uuid.UUID):
@@ -401,122 +429,156 @@ async def run_analysis(scan_uuid: uuid.UUID):
         A dictionary with the calculated saddle position in centimeters.
     """
 
-    async with AsyncSession(engine) as session:
+    async with AsyncSessionLocal() as session:
         scan = await get_scan(session, scan_uuid)
-        ic("got scan")
-        await wait_until_both_ready(session, scan.id)
+        # a resumed analysis may still be running in the process that got the
+        # callback
+        locked = await session.exec(TRY_LOCK_ANALYSIS, params={"scan_id": scan.id})
+        if not locked.one():
+            logging.info("analysis of scan %s is already running", scan_uuid)
+            return
 
-        ic("both image and video are ready")
+        await wait_until_both_ready(session, scan.id)
 
-        photo_result = await get_photo_result(session, scan.id)
-        video_result = await get_video_result(session, scan.id)
-        person = await get_person(session, scan)
+        person, photo_result, video_result = await get_analysis_inputs(session, scan.id)
         frames = video_result["data"]["frames"]
 
-        ic(photo_result)
-        ic(video_result["height"])
-        ic(video_result["width"])
-        ic(video_result["data"]["facing_direction"])
-
         if len(frames) == 0:
-            ic("no frames with joints")
+            logging.debug("no frames with joints, scan: %s", scan_uuid)
             scan_result: ScanResult = {
                 "saddle_x_cm": 0,
                 "saddle_y_cm": 0,
             }
 
-            scan.result = scan_result
-
-            session.add(scan)
-            await session.commit()
-
+            await save_result(session, scan, scan_result)
             return
 
-        ic(frames[0])
-
-        ic("got all results")
-
         # TODO: check if maybe lowest point of ankle and/or foot is better
         _, max_angle_frame = get_min_max_frames(
             frames,
             video_result["data"]["facing_direction"],
         )
-        frame = unnormalize_frame(
-            max_angle_frame,
-            video_result["width"],
-            video_result["height"],
-        )
-
-        foot, knee, hip = get_knee_values(
-            frame["joints"],
-            video_result["data"]["facing_direction"],
+        # only the three points of the leg are needed in pixels, not all joints
+        foot, knee, hip = (
+            unnormalize_point(point, video_result["width"], video_result["height"])
+            for point in get_knee_values(
+                max_angle_frame["joints"],
+                video_result["data"]["facing_direction"],
+            )
         )
 
-        ic(foot, knee, hip)
-
-        knee_angle = get_angle(foot.to_np(), knee.to_np(), hip.to_np())
-
-        ic(knee_angle)
+        knee_angle = get_angle(foot, knee, hip)
+        logging.debug("knee angle of scan %s: %s", scan_uuid, knee_angle)
 
         if is_in_range(knee_angle, CYCLING_KNEE_RANGE):
-            ic("knee angle is in range")
             scan_result: ScanResult = {
                 "saddle_x_cm": 0,
                 "saddle_y_cm": 0,
             }
 
-            scan.result = scan_result
-
-            session.add(scan)
-            await session.commit()
-
+            await save_result(session, scan, scan_result)
             return
 
-        ic("knee angle not in range")
-
         thigh_length = distance_between(hip, knee)
         lower_leg_length = distance_between(knee, foot)
 
-        ic(
-            thigh_length,
-            lower_leg_length,
-        )
-
-        saddle_vec = Point(x=foot.x - hip.x, y=foot.y - hip.y)
-        saddle_vec_length = np.sqrt(saddle_vec.x**2 + saddle_vec.y**2)
-        # saddle_vec_angle = np.arccos(saddle_vec.y / saddle_vec.x)
-
-        ic(saddle_vec, saddle_vec_length)
+        saddle_vec_x, saddle_vec_y = foot.x - hip.x, foot.y - hip.y
+        saddle_vec_length = math.sqrt(saddle_vec_x**2 + saddle_vec_y**2)
+        # saddle_vec_angle = np.arccos(saddle_vec_y / saddle_vec_x)
 
         # use law of cosines
-        new_saddle_length = np.sqrt(
+        new_saddle_length = math.sqrt(
             thigh_length**2
             + lower_leg_length**2
-            - 2
-            * thigh_length
-            * lower_leg_length
-            * np.cos(np.deg2rad(BEST_CYCLING_KNEE_ANGLE))
+            - 2 * thigh_length * lower_leg_length * COS_BEST_CYCLING_KNEE_ANGLE
         )
 
-        ic(new_saddle_length)
-
         saddle_length_diff = new_saddle_length - saddle_vec_length
-        ic(saddle_length_diff)
 
         saddle_lentgh_diff_px = saddle_length_diff
-        ic(saddle_lentgh_diff_px)
 
         pixel_to_cm_ratio = get_px_to_cm_ratio(person, photo_result, video_result)
-        ic(pixel_to_cm_ratio)
         saddle_length_diff_cm = pixel_to_cm_ratio * saddle_lentgh_diff_px
-        ic(saddle_length_diff_cm)
+        logging.debug(
+            "saddle height change of scan %s: %s cm", scan_uuid, saddle_length_diff_cm
+        )
 
         scan_result: ScanResult = {
             "saddle_x_cm": 0,
             "saddle_y_cm": saddle_length_diff_cm,
         }
 
-        scan.result = scan_result
+        await save_result(session, scan, scan_result)
+
+
+async def claim_pending_analyses(session: AsyncSession) -> list[uuid.UUID]:
+    """
+    Claim recent scans whose photo and video are processed but have no result yet.
+
+    Every scan is claimed once, by a single process, so starting more workers
+    doesn't run the same analysis again, and an analysis that keeps failing is
+    not retried on every start.
+
+    Args:
+        session: The database session.
+
+    Returns:
+        The UUIDs of the claimed scans.
+    """
+
+    pending = (
+        select(Scan.id)
+        .join(Photo, Photo.scan_id == Scan.id)
+        .join(Video, Video.scan_id == Scan.id)
+        .where(
+            Photo.status == Status.done,
+            Video.status == Status.done,
+            or_(
+                Scan.result.is_(None),
+                Scan.result == literal({}, JSONB),
+            ),
+            Scan.created_at > datetime.datetime.now() - RESUME_ANALYSES_OF,
+        )
+    )
+    res = await session.exec(
+        update(Scan)
+        .where(Scan.id.in_(pending), Scan.analysis_resumed_at.is_(None))
+        .values(analysis_resumed_at=datetime.datetime.now())
+        .returning(Scan.uuid)
+    )
+    scan_uuids = list(res.scalars().all())
+    await session.commit()
+    return scan_uuids
+
+
+async def resume_analysis(scan_uuid: uuid.UUID) -> None:
+    """
+    Run a claimed analysis.
+
+    If it is cancelled, e.g. by the shutdown, the claim is released, so the next
+    start resumes it again. Failed analyses keep their claim and are not retried.
+
+    Args:
+        scan_uuid: The UUID of the scan.
+    """
+
+    try:
+        await run_analysis(scan_uuid)
+    except asyncio.CancelledError:
+        async with AsyncSessionLocal() as session:
+            await session.exec(RELEASE_ANALYSIS_CLAIM, params={"scan_uuid": scan_uuid})
+            await session.commit()
+        raise
+
+
+async def resume_pending_analyses() -> None:
+    """
+    Schedule the analysis of scans that lost it, e.g. because the API restarted
+    between the video callback and the result being stored.
+    """
+
+    async with AsyncSessionLocal() as session:
+        scan_uuids = await claim_pending_analyses(session)
 
-        session.add(scan)
-        await session.commit()
+    for scan_uuid in scan_uuids:
+        spawn(resume_analysis(scan_uuid), name=f"analysis-{scan_uuid}")
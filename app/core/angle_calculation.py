@@ -1,3 +1,4 @@
+import math
 from mediapipe.python.solutions import pose
 import numpy as np
 import mediapipe as mp
@@ -114,16 +115,13 @@ def calculate_3p_angle(a: np.ndarray, b: np.ndarray, c: np.ndarray) -> int:
     Returns:
     angle
     """
-    v1 = a - b
-    v2 = c - b
+    # atan2 of the cross and dot product needs no magnitudes and no clipping
+    v1_x, v1_y = a[0] - b[0], a[1] - b[1]
+    v2_x, v2_y = c[0] - b[0], c[1] - b[1]
 
-    dot_product = np.dot(v1, v2)
-    magnitude_v1 = np.linalg.norm(v1)
-    magnitude_v2 = np.linalg.norm(v2)
+    cross_product = v1_x * v2_y - v1_y * v2_x
+    dot_product = v1_x * v2_x + v1_y * v2_y
 
-    cosine_angle = dot_product / (magnitude_v1 * magnitude_v2)
-    cosine_angle = np.clip(cosine_angle, -1.0, 1.0)
-
-    angle = np.degrees(np.arccos(cosine_angle))
+    angle = math.degrees(abs(math.atan2(cross_product, dot_product)))
 
     return angle
@@ -0,0 +1,68 @@
+import asyncio
+import logging
+from typing import Any, Coroutine
+
+MAX_CONCURRENT_TASKS = 32
+# stays below the usual 30 s grace period between SIGTERM and SIGKILL
+DRAIN_TIMEOUT_S = 20
+
+_semaphore = asyncio.Semaphore(MAX_CONCURRENT_TASKS)
+# strong references, the event loop only keeps weak ones to running tasks
+_tasks: set[asyncio.Task] = set()
+
+
+async def _run(
+    coro: Coroutine[Any, Any, Any], name: str, limit: asyncio.Semaphore
+) -> None:
+    async with limit:
+        try:
+            await coro
+        except Exception:
+            logging.exception(f"background task {name} failed")
+
+
+def spawn(
+    coro: Coroutine[Any, Any, Any],
+    name: str,
+    limit: asyncio.Semaphore | None = None,
+) -> asyncio.Task:
+    """
+    Run a coroutine in the background.
+
+    At most MAX_CONCURRENT_TASKS run at the same time, the others wait for a free
+    slot. Exceptions are logged instead of being lost with the task.
+
+    Args:
+        coro: The coroutine to run.
+        name: A name for the task, used in logs.
+        limit: A semaphore to wait for instead of the shared one, so long-running
+            kinds of work can be capped separately.
+
+    Returns:
+        The created task.
+    """
+
+    task = asyncio.create_task(_run(coro, name, limit or _semaphore), name=name)
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
+
+
+async def drain() -> None:
+    """
+    Wait for the background tasks to finish, for at most DRAIN_TIMEOUT_S.
+
+    Tasks still running after that, e.g. analyses waiting for their media, are
+    cancelled. Cancelled analyses are resumed on the next start, see
+    resume_pending_analyses.
+    """
+
+    if len(_tasks) == 0:
+        return
+
+    _, pending = await asyncio.wait(set(_tasks), timeout=DRAIN_TIMEOUT_S)
+    for task in pending:
+        task.cancel()
+    if len(pending) > 0:
+        logging.warning(f"cancelled {len(pending)} background tasks on shutdown")
+        await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,60 @@
+import time
+from collections import OrderedDict
+
+
+class TTLCache[K, V]:
+    """
+    A small in-process LRU cache whose entries expire after a fixed time.
+    """
+
+    def __init__(self, maxsize: int, ttl_s: float):
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        self._entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+
+    def get(self, key: K) -> V | None:
+        """
+        Retrieve a cached value.
+
+        Args:
+            key: The key of the entry.
+
+        Returns:
+            The cached value, or None if there is no entry or it has expired.
+        """
+
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: K, value: V) -> None:
+        """
+        Store a value, evicting the least recently used entry if the cache is full.
+
+        Args:
+            key: The key of the entry.
+            value: The value to store.
+        """
+
+        self._entries[key] = (time.monotonic() + self.ttl_s, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: K) -> None:
+        """
+        Remove an entry from the cache, if present.
+
+        Args:
+            key: The key of the entry.
+        """
+
+        self._entries.pop(key, None)
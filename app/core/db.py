@@ -1,19 +1,49 @@
-from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlmodel.ext.asyncio.session import AsyncSession
 import os
 
 
+# the pool is shared by all requests of a worker, tune it per deployment to stay
+# below the database's connection limit across all workers
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE") or 10)
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW") or 20)
+POOL_TIMEOUT_S = 30
+POOL_RECYCLE_S = int(os.getenv("DB_POOL_RECYCLE_S") or 1800)
+# prepared statements are cached per connection, so repeated queries skip the
+# prepare round-trip. set to 0 behind a pgbouncer in transaction mode, which can't
+# keep statements prepared on the server connections it hands out
+STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE") or 100)
+
+connect_args = {
+    "statement_cache_size": STATEMENT_CACHE_SIZE,
+    "prepared_statement_cache_size": STATEMENT_CACHE_SIZE,
+}
+
 if os.getenv("ENV") == "PROD":
-    engine = create_async_engine(
+    url = (
         f"postgresql+asyncpg://{os.getenv("POSTGRES_USER")}:{os.getenv("POSTGRES_PASSWORD")}@/{os.getenv("POSTGRES_DB")}"
-        + f"?host=/cloudsql/{os.getenv("INSTANCE_CONNECTION_NAME")}",
+        + f"?host=/cloudsql/{os.getenv("INSTANCE_CONNECTION_NAME")}"
     )
-
 elif os.getenv("ENV") == "XATA":
-    engine = create_async_engine(
-        f"postgresql+asyncpg://{os.getenv("POSTGRES_USER")}:{os.getenv("POSTGRES_PASSWORD")}@{os.getenv("POSTGRES_ENDPOINT")}/{os.getenv("POSTGRES_DB")}",
-        connect_args={"ssl": True},
-    )
+    url = f"postgresql+asyncpg://{os.getenv("POSTGRES_USER")}:{os.getenv("POSTGRES_PASSWORD")}@{os.getenv("POSTGRES_ENDPOINT")}/{os.getenv("POSTGRES_DB")}"
+    connect_args["ssl"] = True
 else:
-    engine = create_async_engine(
-        f"postgresql+asyncpg://{os.getenv("POSTGRES_USER")}:{os.getenv("POSTGRES_PASSWORD")}@{os.getenv("POSTGRES_ENDPOINT")}/{os.getenv("POSTGRES_DB")}",
-    )
+    url = f"postgresql+asyncpg://{os.getenv("POSTGRES_USER")}:{os.getenv("POSTGRES_PASSWORD")}@{os.getenv("POSTGRES_ENDPOINT")}/{os.getenv("POSTGRES_DB")}"
+
+engine = create_async_engine(
+    url,
+    connect_args=connect_args,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=POOL_SIZE,
+    max_overflow=MAX_OVERFLOW,
+    pool_timeout=POOL_TIMEOUT_S,
+    pool_pre_ping=True,
+    pool_recycle=POOL_RECYCLE_S,
+)
+
+# expire_on_commit=False keeps loaded attributes usable after a commit, so
+# handlers don't need an extra refresh round-trip to build their responses.
+AsyncSessionLocal = async_sessionmaker(
+    engine, class_=AsyncSession, expire_on_commit=False
+)
@@ -1,12 +1,35 @@
 import logging
+import certifi
 from minio import Minio
 import os
+import urllib3
+from urllib3.util import Retry, Timeout
+
+# threads of the executor the S3 calls run in, set up in app/main.py
+EXECUTOR_SIZE = 32
+# connections kept alive between calls instead of opening (and TLS handshaking) a
+# new one each time. besides the executor threads, multipart uploads send their
+# parts from MinIO's own per-upload threads, connections beyond the pool are still
+# opened since block=False, but closed after use
+MAX_CONNECTIONS = EXECUTOR_SIZE
 
 client = Minio(
     os.getenv("S3_ENDPOINT") or "localhost:9000",
     access_key=os.getenv("S3_CLIENT_ID"),
     secret_key=os.getenv("S3_CLIENT_SECRET"),
     secure=os.getenv("ENV") != "DEV",
+    # a known region lets presigned URLs be signed without a request to S3
+    region=os.getenv("S3_REGION") or None,
+    http_client=urllib3.PoolManager(
+        maxsize=MAX_CONNECTIONS,
+        block=False,
+        timeout=Timeout(connect=5, read=60),
+        cert_reqs="CERT_REQUIRED",
+        ca_certs=os.getenv("SSL_CERT_FILE") or certifi.where(),
+        retries=Retry(
+            total=5, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504]
+        ),
+    ),
 )
 
 bucket_name = os.getenv("S3_BUCKET") or ""
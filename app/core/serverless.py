@@ -1,5 +1,15 @@
-from httpx import AsyncClient, AsyncHTTPTransport
+import asyncio
+from httpx import (
+    AsyncClient,
+    AsyncHTTPTransport,
+    ConnectError,
+    ConnectTimeout,
+    Limits,
+    Response,
+)
+import orjson
 import os
+import random
 
 from app.apimodels import ProcessType
 
@@ -8,26 +18,97 @@ if serverless_url == "":
     raise Exception("SERVERLESS_URL environment varable not set")
 
 RETRIES = 5
+RETRY_BASE_DELAY_S = 0.5
+RETRY_MAX_DELAY_S = 10
+# throttled or not forwarded by the gateway, so the job was not queued. other
+# errors are not retried, the job might have been queued and would run twice
+RETRY_STATUS_CODES = frozenset({429, 502, 503, 504})
+MAX_CONNECTIONS = 100
+MAX_KEEPALIVE_CONNECTIONS = 50
+# uploads come in bursts, idle connections are kept long enough to be reused by
+# the next one instead of paying a new TLS handshake
+KEEPALIVE_EXPIRY_S = 60
+# in-flight invocations, each one only waits until the job is queued
+MAX_CONCURRENT_CALLS = 16
+CALL_TIMEOUT_S = 30
 
-transport = AsyncHTTPTransport(retries=RETRIES)
+# the token doesn't change at runtime, so the headers are set once on the client
+CALL_HEADERS = {
+    "Authorization": f"Bearer {os.getenv("SERVERLESS_TOKEN")}",
+    "Content-Type": "application/json",
+}
+# the body always has the same shape, process types and scan uuids never need
+# escaping
+CALL_BODY_TEMPLATE = (
+    b'{"input":{"process_type":"%b","scan_uuid":"%b","file_extension":%b}}'
+)
+
+# pass to background.spawn so calls don't take the slots of other background work
+call_limit = asyncio.Semaphore(MAX_CONCURRENT_CALLS)
+
+# HTTP/2 multiplexes concurrent calls over a few connections
+transport = AsyncHTTPTransport(
+    http2=True,
+    limits=Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY_S,
+    ),
+)
+# shared by all calls so connections are kept alive, closed on shutdown
+client = AsyncClient(transport=transport, headers=CALL_HEADERS)
+
+
+async def _post_with_retries(url: str, content: bytes) -> Response:
+    """
+    Post to the serverless endpoint, retrying with exponential backoff and jitter
+    if the request could not be delivered.
+
+    Args:
+        url: The URL to post to.
+        content: The JSON body.
+
+    Returns:
+        The response of the last attempt.
+
+    Raises:
+        httpx.TransportError: If the last attempt failed to connect or send.
+    """
+
+    for attempt in range(RETRIES - 1):
+        try:
+            response = await client.post(url, content=content, timeout=CALL_TIMEOUT_S)
+            if response.status_code not in RETRY_STATUS_CODES:
+                return response
+        except (ConnectError, ConnectTimeout):
+            pass
+
+        # jitter keeps calls that failed together from retrying together
+        delay = min(RETRY_MAX_DELAY_S, RETRY_BASE_DELAY_S * 1.5**attempt)
+        await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+
+    return await client.post(url, content=content, timeout=CALL_TIMEOUT_S)
 
 
 async def call_serverless(
     scan_uuid: str, process_type: ProcessType, file_extension: str
 ) -> None:
-    async with AsyncClient(transport=transport) as client:
-        content = {
-            "input": {
-                "process_type": process_type,
-                "scan_uuid": scan_uuid,
-                "file_extension": file_extension,
-            }
-        }
-        result = await client.post(
-            serverless_url + "/runsync",
-            json=content,
-            headers={"Authorization": f"Bearer {os.getenv("SERVERLESS_TOKEN")}"},
-            timeout=500,
-        )
-        if result.status_code != 200:
-            raise Exception(result)
+    # the extension comes from the uploaded filename, so it is the only value that
+    # still needs escaping
+    content = CALL_BODY_TEMPLATE % (
+        process_type.encode(),
+        scan_uuid.encode(),
+        orjson.dumps(file_extension),
+    )
+    # the job is only queued, the worker reports its result through the callback
+    result = await _post_with_retries(serverless_url + "/run", content)
+    if result.status_code != 200:
+        raise Exception(result)
+
+
+async def close_client() -> None:
+    """
+    Close the connections of the shared client.
+    """
+
+    await client.aclose()
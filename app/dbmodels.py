@@ -3,8 +3,10 @@ import uuid as uuids
 import datetime
 
 from typing import Any, Literal, Optional, TypedDict, Union
-from sqlalchemy import Column
-from sqlmodel import JSON, Enum, Field, SQLModel, Column
+from sqlalchemy import Column, Index, SmallInteger, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlmodel import Enum, Field, SQLModel, Column
+from uuid_utils.compat import uuid7
 
 
 class BaseTable(SQLModel):
@@ -13,21 +15,36 @@ class BaseTable(SQLModel):
 
 class Person(BaseTable, table=True):
     uuid: uuids.UUID = Field(
-        default_factory=uuids.uuid4,
+        default_factory=uuid7,
         unique=True,
+        index=True,
     )
     name: str
-    height_cm: int
+    # smallint like the column, CreatePersonInformation keeps values in its range
+    height_cm: int = Field(sa_column=Column(SmallInteger, nullable=False))
 
 
 class Scan(BaseTable, table=True):
-    uuid: uuids.UUID = Field(
-        default_factory=uuids.uuid4,
-        unique=True,
+    __table_args__ = (
+        Index(
+            "ix_scan_person_id_created_at_id",
+            "person_id",
+            text("created_at DESC"),
+            text("id DESC"),
+            postgresql_include=["uuid"],
+        ),
+        # unique, and covers resolving a scan uuid to its id
+        Index(
+            "ix_scan_uuid_include_id", "uuid", unique=True, postgresql_include=["id"]
+        ),
     )
+
+    uuid: uuids.UUID = Field(default_factory=uuid7)
     person_id: Optional[int] = Field(default=None, foreign_key="person.id")
-    result: Optional[Any] = Field(default_factory=dict, sa_column=Column(JSON))
+    result: Optional[Any] = Field(default_factory=dict, sa_column=Column(JSONB))
     created_at: datetime.datetime
+    # claimed by resume_pending_analyses, lost analyses are resumed only once
+    analysis_resumed_at: Optional[datetime.datetime] = None
 
 
 class Status(str, enum.Enum):
@@ -36,15 +53,15 @@ class Status(str, enum.Enum):
 
 
 class Photo(BaseTable, table=True):
-    scan_id: int = Field(default=None, foreign_key="scan.id", unique=True)
+    scan_id: int = Field(default=None, foreign_key="scan.id", unique=True, index=True)
     status: Status = Field(sa_column=Column(Enum(Status)))
-    process_result: Optional[Any] = Field(default=None, sa_column=Column(JSON))
+    process_result: Optional[Any] = Field(default=None, sa_column=Column(JSONB))
 
 
 class Video(BaseTable, table=True):
-    scan_id: int = Field(default=None, foreign_key="scan.id", unique=True)
+    scan_id: int = Field(default=None, foreign_key="scan.id", unique=True, index=True)
     status: Status = Field(sa_column=Column(Enum(Status)))
-    process_result: Optional[Any] = Field(default=None, sa_column=Column(JSON))
+    process_result: Optional[Any] = Field(default=None, sa_column=Column(JSONB))
 
 
 class PhotoResult(TypedDict):
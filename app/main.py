@@ -2,14 +2,54 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import anyio.to_thread
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from app.api.main import api_router
+from app.api.routes.scans import MAX_PHOTO_BYTES
+from app.core.analysis import resume_pending_analyses
+from app.core.background import drain, spawn
+from app.core.s3 import EXECUTOR_SIZE
+from app.core.serverless import close_client
+from starlette.formparsers import MultiPartParser
 from starlette.middleware.cors import CORSMiddleware
-from icecream import ic
 
-ic.disable()
+# spooled upload reads and form parsing run in the anyio threadpool
+THREADPOOL_SIZE = 64
+# uploads up to this size stay in memory instead of being spooled to a temporary
+# file and read back for the S3 upload, this covers photos but not videos
+UPLOAD_SPOOL_BYTES = MAX_PHOTO_BYTES
 
-app = FastAPI(title="Bike Fitting API", openapi_url="/api/openapi.json")
+# starlette 0.40 sizes its spooled temporary files by max_file_size
+MultiPartParser.max_file_size = UPLOAD_SPOOL_BYTES
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    # S3 calls run in the default executor through asyncio.to_thread, its default
+    # size of cpu count + 4 is quickly taken by overlapping uploads
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=EXECUTOR_SIZE, thread_name_prefix="s3")
+    )
+    # analyses only live in memory, the database tells which ones were lost
+    spawn(resume_pending_analyses(), name="resume-analyses")
+    yield
+    # let running uploads finish their serverless calls before shutting down
+    await drain()
+    await close_client()
+
+
+app = FastAPI(
+    title="Bike Fitting API",
+    openapi_url="/api/openapi.json",
+    lifespan=lifespan,
+    # serializes responses with orjson instead of the stdlib json module
+    default_response_class=ORJSONResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -1,4 +1,25 @@
-ALTER TABLE scan ADD CONSTRAINT uq_scan_uuid UNIQUE(uuid);
-ALTER TABLE person ADD CONSTRAINT uq_person_uuid UNIQUE(uuid);
+-- every migration is re-run on each deploy, the uuid constraints are only added
+-- while no other single-column unique index covers the column, so the later
+-- migrations that drop the duplicates aren't undone on the next run
+DO $$
+BEGIN
+IF NOT EXISTS (
+    SELECT 1 FROM pg_index i
+    JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+    WHERE i.indrelid = 'scan'::regclass AND a.attname = 'uuid'
+    AND i.indisunique AND i.indisvalid AND i.indnkeyatts = 1
+) THEN
+    ALTER TABLE scan ADD CONSTRAINT uq_scan_uuid UNIQUE(uuid);
+END IF;
+IF NOT EXISTS (
+    SELECT 1 FROM pg_index i
+    JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+    WHERE i.indrelid = 'person'::regclass AND a.attname = 'uuid'
+    AND i.indisunique AND i.indisvalid AND i.indnkeyatts = 1
+) THEN
+    ALTER TABLE person ADD CONSTRAINT uq_person_uuid UNIQUE(uuid);
+END IF;
+END;
+$$;
 ALTER TABLE photo ADD CONSTRAINT uq_photo_scan_id UNIQUE(scan_id);
 ALTER TABLE video ADD CONSTRAINT uq_video_scan_id UNIQUE(scan_id);
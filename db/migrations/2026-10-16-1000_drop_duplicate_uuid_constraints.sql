@@ -0,0 +1,6 @@
+-- person.uuid and scan.uuid are already unique (and thereby indexed) since the
+-- initial migration, uq_person_uuid and uq_scan_uuid only add a second identical
+-- index that has to be maintained on every insert. the 2024-10-11 migration
+-- doesn't add them back once they are dropped.
+ALTER TABLE scan DROP CONSTRAINT IF EXISTS uq_scan_uuid;
+ALTER TABLE person DROP CONSTRAINT IF EXISTS uq_person_uuid;
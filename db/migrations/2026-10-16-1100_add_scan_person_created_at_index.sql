@@ -0,0 +1,31 @@
+-- covers listing the scans of a person newest first, the id breaks ties between
+-- scans created together and uuid is included, so the listing is answered by an
+-- index-only scan without a sort.
+
+-- a failed concurrent build leaves an invalid index behind, which IF NOT EXISTS
+-- would skip on every later run
+DO $$
+BEGIN
+IF EXISTS (
+    SELECT 1 FROM pg_index
+    WHERE indexrelid = to_regclass('ix_scan_person_id_created_at_id') AND NOT indisvalid
+) THEN
+    DROP INDEX ix_scan_person_id_created_at_id;
+END IF;
+END;
+$$;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_scan_person_id_created_at_id
+ON scan (person_id, created_at DESC, id DESC) INCLUDE (uuid);
+
+-- replaces the earlier index without the id, once the new one can be used
+DO $$
+BEGIN
+IF EXISTS (
+    SELECT 1 FROM pg_index
+    WHERE indexrelid = to_regclass('ix_scan_person_id_created_at_id') AND indisvalid
+) THEN
+    DROP INDEX IF EXISTS ix_scan_person_id_created_at;
+END IF;
+END;
+$$;
@@ -0,0 +1,12 @@
+-- lets the API wait for processed photos and videos with LISTEN instead of
+-- polling their status, the payload is the scan id
+CREATE OR REPLACE FUNCTION notify_media_done()
+RETURNS TRIGGER AS $$
+BEGIN
+PERFORM pg_notify('media_done', NEW.scan_id::text);
+RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+CREATE OR REPLACE TRIGGER notify_photo_done AFTER INSERT OR UPDATE OF status ON photo FOR EACH ROW WHEN (NEW.status = 'done') EXECUTE PROCEDURE notify_media_done();
+CREATE OR REPLACE TRIGGER notify_video_done AFTER INSERT OR UPDATE OF status ON video FOR EACH ROW WHEN (NEW.status = 'done') EXECUTE PROCEDURE notify_media_done();
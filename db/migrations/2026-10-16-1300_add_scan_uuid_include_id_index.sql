@@ -0,0 +1,31 @@
+-- every scan route resolves the scan uuid to its id, including the id answers
+-- that with an index-only scan. the index enforces uniqueness on its own, so the
+-- unique constraint from the initial migration would only be a second copy.
+
+-- a failed concurrent build leaves an invalid index behind, which IF NOT EXISTS
+-- would skip on every later run
+DO $$
+BEGIN
+IF EXISTS (
+    SELECT 1 FROM pg_index
+    WHERE indexrelid = to_regclass('ix_scan_uuid_include_id') AND NOT indisvalid
+) THEN
+    DROP INDEX ix_scan_uuid_include_id;
+END IF;
+END;
+$$;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ix_scan_uuid_include_id
+ON scan (uuid) INCLUDE (id);
+
+-- the constraint is only dropped once the index can take over its uniqueness
+DO $$
+BEGIN
+IF EXISTS (
+    SELECT 1 FROM pg_index
+    WHERE indexrelid = to_regclass('ix_scan_uuid_include_id') AND indisvalid
+) THEN
+    ALTER TABLE scan DROP CONSTRAINT IF EXISTS scan_uuid_key;
+END IF;
+END;
+$$;
@@ -0,0 +1,3 @@
+-- set when a starting API process claims a lost analysis, so it is resumed by a
+-- single process and only once
+ALTER TABLE scan ADD COLUMN IF NOT EXISTS analysis_resumed_at TIMESTAMP;
@@ -1,9 +1,55 @@
-import mediapipe as mp
-import numpy as np
+import math
+from mediapipe.python.solutions.pose import PoseLandmark
 from mediapipe.tasks.python.components.containers.landmark import NormalizedLandmark
+from typing import Sequence
 
 from config import FacingDirection
 
+# resolved once, these functions run for every frame of a video
+LEFT_SHOULDER = PoseLandmark.LEFT_SHOULDER.value
+LEFT_ELBOW = PoseLandmark.LEFT_ELBOW.value
+LEFT_WRIST = PoseLandmark.LEFT_WRIST.value
+LEFT_HIP = PoseLandmark.LEFT_HIP.value
+LEFT_KNEE = PoseLandmark.LEFT_KNEE.value
+LEFT_ANKLE = PoseLandmark.LEFT_ANKLE.value
+RIGHT_SHOULDER = PoseLandmark.RIGHT_SHOULDER.value
+RIGHT_ELBOW = PoseLandmark.RIGHT_ELBOW.value
+RIGHT_WRIST = PoseLandmark.RIGHT_WRIST.value
+RIGHT_HIP = PoseLandmark.RIGHT_HIP.value
+RIGHT_KNEE = PoseLandmark.RIGHT_KNEE.value
+RIGHT_ANKLE = PoseLandmark.RIGHT_ANKLE.value
+
+# (a, vertex, c) landmark indices of the measured angles
+LEFT_KNEE_LANDMARKS = (LEFT_HIP, LEFT_KNEE, LEFT_ANKLE)
+RIGHT_KNEE_LANDMARKS = (RIGHT_HIP, RIGHT_KNEE, RIGHT_ANKLE)
+LEFT_ELBOW_LANDMARKS = (LEFT_SHOULDER, LEFT_ELBOW, LEFT_WRIST)
+RIGHT_ELBOW_LANDMARKS = (RIGHT_SHOULDER, RIGHT_ELBOW, RIGHT_WRIST)
+
+
+def _get_landmark_angle(
+    landmarks: list[NormalizedLandmark], frame, indices: tuple[int, int, int]
+) -> float:
+    """
+    Calculate the angle at the middle of three landmarks, in pixel space.
+
+    Args:
+        landmarks (list[NormalizedLandmark]): A list of normalized landmarks representing body key points.
+        frame: The frame object containing width and height attributes.
+        indices (tuple[int, int, int]): The indices of the three landmarks, the vertex in the middle.
+
+    Returns:
+        float: The calculated angle in degrees.
+    """
+    width = frame.width
+    height = frame.height
+    a, b, c = (landmarks[index] for index in indices)
+
+    return calculate_angle(
+        (a.x * width, a.y * height),
+        (b.x * width, b.y * height),
+        (c.x * width, c.y * height),
+    )
+
 
 def get_knee_angle(landmarks: list[NormalizedLandmark], frame, facing_direction) -> int:
     """
@@ -18,45 +64,9 @@ def get_knee_angle(landmarks: list[NormalizedLandmark], frame, facing_direction)
         int: The calculated knee angle in degrees.
 
     """
-    mp_pose = mp.solutions.pose
-    lm = landmarks
-    width = frame.width
-    height = frame.height
-
     if facing_direction == "left":
-        hip = [
-            lm[mp_pose.PoseLandmark.LEFT_HIP.value].x * width,
-            lm[mp_pose.PoseLandmark.LEFT_HIP.value].y * height,
-        ]
-        knee = [
-            lm[mp_pose.PoseLandmark.LEFT_KNEE.value].x * width,
-            lm[mp_pose.PoseLandmark.LEFT_KNEE.value].y * height,
-        ]
-        ankle = [
-            lm[mp_pose.PoseLandmark.LEFT_ANKLE.value].x * width,
-            lm[mp_pose.PoseLandmark.LEFT_ANKLE.value].y * height,
-        ]
-    else:
-        hip = [
-            lm[mp_pose.PoseLandmark.RIGHT_HIP.value].x * width,
-            lm[mp_pose.PoseLandmark.RIGHT_HIP.value].y * height,
-        ]
-        knee = [
-            lm[mp_pose.PoseLandmark.RIGHT_KNEE.value].x * width,
-            lm[mp_pose.PoseLandmark.RIGHT_KNEE.value].y * height,
-        ]
-        ankle = [
-            lm[mp_pose.PoseLandmark.RIGHT_ANKLE.value].x * width,
-            lm[mp_pose.PoseLandmark.RIGHT_ANKLE.value].y * height,
-        ]
-
-    hip_array = np.array(hip)
-    knee_array = np.array(knee)
-    ankle_array = np.array(ankle)
-
-    angle = calculate_angle(hip_array, knee_array, ankle_array)
-
-    return angle
+        return _get_landmark_angle(landmarks, frame, LEFT_KNEE_LANDMARKS)
+    return _get_landmark_angle(landmarks, frame, RIGHT_KNEE_LANDMARKS)
 
 
 def get_elbow_angle(
@@ -72,70 +82,35 @@ def get_elbow_angle(
     Returns:
         int: The calculated elbow angle in degrees.
     """
-    mp_pose = mp.solutions.pose
-    lm = landmarks
-    width = frame.width
-    height = frame.height
-
     if facing_direction == "left":
-        shoulders = [
-            lm[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x * width,
-            lm[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y * height,
-        ]
-        elbow = [
-            lm[mp_pose.PoseLandmark.LEFT_ELBOW.value].x * width,
-            lm[mp_pose.PoseLandmark.LEFT_ELBOW.value].y * height,
-        ]
-        wrist = [
-            lm[mp_pose.PoseLandmark.LEFT_WRIST.value].x * width,
-            lm[mp_pose.PoseLandmark.LEFT_WRIST.value].y * height,
-        ]
-    else:
-        shoulders = [
-            lm[mp_pose.PoseLandmark.RIGHT_SHOULDER.value].x * width,
-            lm[mp_pose.PoseLandmark.RIGHT_SHOULDER.value].y * height,
-        ]
-        elbow = [
-            lm[mp_pose.PoseLandmark.RIGHT_ELBOW.value].x * width,
-            lm[mp_pose.PoseLandmark.RIGHT_ELBOW.value].y * height,
-        ]
-        wrist = [
-            lm[mp_pose.PoseLandmark.RIGHT_WRIST.value].x * width,
-            lm[mp_pose.PoseLandmark.RIGHT_WRIST.value].y * height,
-        ]
-
-    shoulders_array = np.array(shoulders)
-    elbow_array = np.array(elbow)
-    wrist_array = np.array(wrist)
-
-    angle = calculate_angle(shoulders_array, elbow_array, wrist_array)
+        return _get_landmark_angle(landmarks, frame, LEFT_ELBOW_LANDMARKS)
+    return _get_landmark_angle(landmarks, frame, RIGHT_ELBOW_LANDMARKS)
 
-    return angle
 
-
-def calculate_angle(a: np.ndarray, b: np.ndarray, c: np.ndarray) -> int:
+def calculate_angle(
+    a: Sequence[float], b: Sequence[float], c: Sequence[float]
+) -> float:
     """
     Calculate the angle formed by three points in a 2D space.
 
+    Works on plain (x, y) sequences, per frame NumPy arrays only add allocations.
+
     Args:
-        a (np.ndarray): A 1D array representing the coordinates of the first point.
-        b (np.ndarray): A 1D array representing the coordinates of the vertex point.
-        c (np.ndarray): A 1D array representing the coordinates of the second point.
+        a (Sequence[float]): The (x, y) coordinates of the first point.
+        b (Sequence[float]): The (x, y) coordinates of the vertex point.
+        c (Sequence[float]): The (x, y) coordinates of the second point.
 
     Returns:
-        int: The calculated angle in degrees, rounded to the nearest integer.
+        float: The calculated angle in degrees.
     """
-    v1 = a - b
-    v2 = c - b
-
-    dot_product = np.dot(v1, v2)
-    magnitude_v1 = np.linalg.norm(v1)
-    magnitude_v2 = np.linalg.norm(v2)
+    # atan2 of the cross and dot product needs no magnitudes and no clipping
+    v1_x, v1_y = a[0] - b[0], a[1] - b[1]
+    v2_x, v2_y = c[0] - b[0], c[1] - b[1]
 
-    cosine_angle = dot_product / (magnitude_v1 * magnitude_v2)
-    cosine_angle = np.clip(cosine_angle, -1.0, 1.0)
+    cross_product = v1_x * v2_y - v1_y * v2_x
+    dot_product = v1_x * v2_x + v1_y * v2_y
 
-    angle = np.degrees(np.arccos(cosine_angle))
+    angle = math.degrees(abs(math.atan2(cross_product, dot_product)))
 
     return angle
 
@@ -158,12 +133,11 @@ def determine_facing_direction(
     Returns:
         FacingDirection: A string indicating the facing direction, either "left" or "right".
     """
-    mp_pose = mp.solutions.pose
     lm = landmarks
-    r_wrist_x = lm[mp_pose.PoseLandmark.RIGHT_WRIST.value].x
-    r_elbow_x = lm[mp_pose.PoseLandmark.RIGHT_ELBOW.value].x
-    l_wrist_x = lm[mp_pose.PoseLandmark.LEFT_WRIST.value].x
-    l_elbow_x = lm[mp_pose.PoseLandmark.LEFT_ELBOW.value].x
+    r_wrist_x = lm[RIGHT_WRIST].x
+    r_elbow_x = lm[RIGHT_ELBOW].x
+    l_wrist_x = lm[LEFT_WRIST].x
+    l_elbow_x = lm[LEFT_ELBOW].x
 
     if l_wrist_x < l_elbow_x:
         return "left"
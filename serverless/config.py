@@ -30,6 +30,8 @@ class ProcessingConfig(BaseModel):
     gpu_enabled: bool = Field(default=True)
     min_pose_confidence: float = Field(default=0.8)
     min_tracking_confidence: float = Field(default=0.8)
+    # only every n-th video frame is decoded, analyzed and written
+    frame_stride: int = Field(default=1, ge=1)
 
 
 class Config(BaseModel):
@@ -64,7 +66,10 @@ def get_config() -> Config:
             backend_url=os.getenv("BACKEND_URL", ""),
             retries=int(os.getenv("API_RETRIES", "3")),
         ),
-        processing=ProcessingConfig(gpu_enabled=check_gpu_availability()),
+        processing=ProcessingConfig(
+            gpu_enabled=check_gpu_availability(),
+            frame_stride=int(os.getenv("FRAME_STRIDE", "1")),
+        ),
         environment=os.getenv("ENV", "production"),
     )
 
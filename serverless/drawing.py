@@ -1,8 +1,19 @@
+import math
 import cv2
 import numpy as np
-from mediapipe.python.solutions import pose
 
 import constants
+from calculation import LEFT_KNEE_LANDMARKS, RIGHT_KNEE_LANDMARKS
+
+# index arrays resolved once, the wireframe is drawn on every frame of a video
+JOINT_INDICES = {
+    direction: np.array(indices, dtype=np.intp)
+    for direction, indices in constants.BODY_LANDMARKS.items()
+}
+CONNECTION_INDICES = {
+    direction: np.array(connections, dtype=np.intp)
+    for direction, connections in constants.BODY_CONNECTIONS.items()
+}
 
 
 def draw_knee_angle_arc(frame, hip, knee, ankle):
@@ -17,31 +28,27 @@ def draw_knee_angle_arc(frame, hip, knee, ankle):
         ankle: (x, y) coordinates of the ankle landmark (normalized)
     """
     h, w = frame.shape[:2]
-    knee_px = (int(knee[0] * w), int(knee[1] * h))
-
-    thigh_vector = np.array([hip[0] * w - knee[0] * w, hip[1] * h - knee[1] * h])
-    shin_vector = np.array([ankle[0] * w - knee[0] * w, ankle[1] * h - knee[1] * h])
-
-    thigh_length = np.linalg.norm(thigh_vector)
-    shin_length = np.linalg.norm(shin_vector)
+    knee_x, knee_y = knee[0] * w, knee[1] * h
+    knee_px = (int(knee_x), int(knee_y))
 
-    radius = int(min(thigh_length, shin_length) * 0.3)
+    thigh_x, thigh_y = hip[0] * w - knee_x, hip[1] * h - knee_y
+    shin_x, shin_y = ankle[0] * w - knee_x, ankle[1] * h - knee_y
 
-    start_angle = np.degrees(np.arctan2(thigh_vector[1], thigh_vector[0]))
-    end_angle = np.degrees(np.arctan2(shin_vector[1], shin_vector[0]))
+    radius = int(min(math.hypot(thigh_x, thigh_y), math.hypot(shin_x, shin_y)) * 0.3)
 
-    start_angle = start_angle % 360
-    end_angle = end_angle % 360
-
-    diff1 = (end_angle - start_angle) % 360
-    diff2 = (start_angle - end_angle) % 360
+    # signed angle from the thigh to the shin, its magnitude is at most 180
+    # degrees, so sweeping it from the thigh always draws the minor arc
+    swept = math.degrees(
+        math.atan2(
+            thigh_x * shin_y - thigh_y * shin_x, thigh_x * shin_x + thigh_y * shin_y
+        )
+    )
+    thigh_angle = math.degrees(math.atan2(thigh_y, thigh_x)) % 360
 
-    if diff1 <= diff2:
-        arc_start = start_angle
-        arc_end = start_angle + diff1
+    if swept >= 0:
+        arc_start, arc_end = thigh_angle, thigh_angle + swept
     else:
-        arc_start = end_angle
-        arc_end = end_angle + diff2
+        arc_start, arc_end = thigh_angle + swept, thigh_angle
 
     cv2.ellipse(
         frame,
@@ -63,38 +70,39 @@ def draw_wireframe(frame, landmarks, facing_direction):
         frame: The video frame to draw on
         landmarks: calculated landmarks of the person
     """
-    for connection in constants.BODY_CONNECTIONS[facing_direction]:
-        start_idx, end_idx = connection
-        start = landmarks[start_idx]
-        end = landmarks[end_idx]
-
-        start_coords = (int(start.x * frame.shape[1]), int(start.y * frame.shape[0]))
-        end_coords = (int(end.x * frame.shape[1]), int(end.y * frame.shape[0]))
-
-        cv2.line(
-            frame,
-            start_coords,
-            end_coords,
-            constants.LINE_COLOR,
-            3,
-            lineType=cv2.LINE_AA,
-        )
+    h, w = frame.shape[:2]
+    # all landmarks are scaled to pixels at once, then picked by index
+    points = np.fromiter(
+        (value for landmark in landmarks for value in (landmark.x, landmark.y)),
+        dtype=np.float32,
+        count=2 * len(landmarks),
+    ).reshape(-1, 2)
+    points_px = (points * np.array([w, h], dtype=np.float32)).astype(np.int32)
+
+    # each connection is a two-point polyline, all are drawn in a single call
+    segments = points_px[CONNECTION_INDICES[facing_direction]]
+    cv2.polylines(
+        frame,
+        list(segments),
+        False,
+        constants.LINE_COLOR,
+        3,
+        lineType=cv2.LINE_AA,
+    )
 
-    for idx in constants.BODY_LANDMARKS[facing_direction]:
-        landmark = landmarks[idx]
-        coords = (int(landmark.x * frame.shape[1]), int(landmark.y * frame.shape[0]))
-        overlay = frame.copy()
+    # the joints share one overlay, so the frame is copied and blended only once
+    overlay = frame.copy()
+    for coords in points_px[JOINT_INDICES[facing_direction]].tolist():
         cv2.circle(overlay, coords, 10, constants.JOINT_COLOR, -1)
-        cv2.addWeighted(overlay, 0.6, frame, 0.4, 0, frame)
+    cv2.addWeighted(overlay, 0.6, frame, 0.4, 0, frame)
 
     if facing_direction == "left":
-        hip = landmarks[pose.PoseLandmark.LEFT_HIP]
-        knee = landmarks[pose.PoseLandmark.LEFT_KNEE]
-        ankle = landmarks[pose.PoseLandmark.LEFT_ANKLE]
+        hip_idx, knee_idx, ankle_idx = LEFT_KNEE_LANDMARKS
     else:
-        hip = landmarks[pose.PoseLandmark.RIGHT_HIP]
-        knee = landmarks[pose.PoseLandmark.RIGHT_HIP]
-        ankle = landmarks[pose.PoseLandmark.RIGHT_ANKLE]
+        hip_idx, knee_idx, ankle_idx = RIGHT_KNEE_LANDMARKS
+    hip = landmarks[hip_idx]
+    knee = landmarks[knee_idx]
+    ankle = landmarks[ankle_idx]
 
     hip_coords = (hip.x, hip.y)
     knee_coords = (knee.x, knee.y)
@@ -1,6 +1,5 @@
 import logging
 import os
-import uuid
 from contextlib import contextmanager
 from dataclasses import dataclass
 from pathlib import Path
@@ -20,7 +19,6 @@ class VideoFile:
 
     scan_uuid: str
     extension: str
-    local_path: Path
 
     @property
     def output_path(self) -> Path:
@@ -48,7 +46,6 @@ class PhotoFile:
     """Represents a photo file in the system."""
 
     scan_uuid: str
-    local_path: Path
 
     @property
     def remote_path(self) -> str:
@@ -98,27 +95,30 @@ class ProcessingHandler:
                 except FileNotFoundError:
                     pass
 
-    def _convert_if_mov(self, video: VideoFile) -> Path:
+    async def _fetch_video(self, video: VideoFile, storage_path: str) -> str | Path:
         """
-        Converts a MOV video file to MP4 format if the file extension is MOV.
+        Makes the uploaded video available as a source OpenCV can read.
 
-        If the provided video file does not have a 'mov' extension, the function
-        returns the original local path. If the extension is 'mov', the function
-        converts the file to MP4 format and returns the path of the converted file.
+        Neither format is downloaded first. MP4 files are streamed from storage
+        while their frames are processed, so the transfer overlaps with the pose
+        detection. FFmpeg reads MOV files straight from storage and only the
+        converted MP4 is written to disk.
 
         Args:
-            video (VideoFile): The video file object containing the local path and
-            converted path.
+            video (VideoFile): The video file object containing the converted path.
+            storage_path (str): The path of the uploaded video in the storage bucket.
 
         Returns:
-            Path: The path of the converted MP4 file or the original local path
-            if no conversion was necessary.
+            str | Path: The path of the converted MP4 file, or a presigned URL of
+            the upload if no conversion was necessary.
         """
         if video.extension.lower() != "mov":
-            return video.local_path
+            logging.info(f"Streaming video: {storage_path}")
+            return self.storage_client.presigned_url(storage_path)
 
-        logging.info(f"Converting MOV file: {video.local_path}")
-        self.video_processor.mov_to_mp4(video.local_path, video.converted_path)
+        logging.info(f"Converting MOV file: {storage_path}")
+        source_url = self.storage_client.presigned_url(storage_path)
+        await self.video_processor.mov_to_mp4(source_url, video.converted_path)
         return video.converted_path
 
     async def process_file(
@@ -218,17 +218,11 @@ class ProcessingHandler:
         Raises:
             RuntimeError: If video processing fails
         """
-        local_path = Path(f"{uuid.uuid4()}.{file_extension.lower()}")
-        video = VideoFile(scan_uuid, file_extension, local_path)
+        video = VideoFile(scan_uuid, file_extension)
         storage_path = f"{self.storage_client.video_path}{video.remote_path}"
         try:
-            with self._manage_temp_files(
-                video.local_path, video.output_path, video.converted_path
-            ):
-                self.storage_client.download_file(storage_path, video.local_path)
-                logging.info(f"Downloaded video: {storage_path}")
-
-                process_path = self._convert_if_mov(video)
+            with self._manage_temp_files(video.output_path, video.converted_path):
+                process_path = await self._fetch_video(video, storage_path)
 
                 result = self.video_processor.process_video(
                     process_path, video.output_path
@@ -252,9 +246,8 @@ class ProcessingHandler:
         """
         Handles the processing of a photo file associated with a specific scan UUID.
 
-        This asynchronous method downloads the photo from storage, processes it,
-        and returns the result. It manages temporary file cleanup to ensure no
-        leftover files remain.
+        This asynchronous method downloads the photo from storage into memory,
+        processes it, and returns the result. Nothing is written to disk.
 
         Args:
             scan_uuid (str): The unique identifier for the scan associated with the photo.
@@ -266,14 +259,11 @@ class ProcessingHandler:
             Exception: If an error occurs during file download or processing.
         """
 
-        local_path = Path(f"{uuid.uuid4()}.jpg")
-        photo = PhotoFile(scan_uuid, local_path)
+        photo = PhotoFile(scan_uuid)
         storage_path = f"{self.storage_client.photo_path}{photo.remote_path}"
         try:
-            with self._manage_temp_files(photo.local_path):
-                self.storage_client.download_file(storage_path, photo.local_path)
-                result = self.photo_processor.process_photo(photo)
-                return result
+            data = self.storage_client.download_bytes(storage_path)
+            return self.photo_processor.process_photo(data)
 
         except Exception as e:
             logging.error(f"Error processing video {scan_uuid}: {str(e)}")
@@ -1,4 +1,3 @@
-import asyncio
 import logging
 from typing import Any, Dict
 import runpod
@@ -34,7 +33,11 @@ def initialize_services() -> ProcessingHandler:
         min_tracking_confidence=config.processing.min_tracking_confidence,
     )
 
-    video_processor = VideoProcessor(mediapipe_processor, config.processing.gpu_enabled)
+    video_processor = VideoProcessor(
+        mediapipe_processor,
+        config.processing.gpu_enabled,
+        frame_stride=config.processing.frame_stride,
+    )
     photo_processor = PhotoProcessor(config.processing.segmenter_path)
     processing_handler = ProcessingHandler(
         storage_client=storage_client,
@@ -74,10 +77,14 @@ async def process_job(job: Dict[str, Any]) -> str:
         raise
 
 
-def serverless_handler(job: Dict[str, Any]) -> str:
-    """RunPod serverless handler."""
-    asyncio.create_task(process_job(job))
-    return "Started processing"
+async def serverless_handler(job: Dict[str, Any]) -> str:
+    """
+    RunPod serverless handler.
+
+    Jobs are queued asynchronously by the backend, so the handler can process the
+    job to completion and the worker stays alive until it is done.
+    """
+    return await process_job(job)
 
 
 def main():
@@ -1,7 +1,6 @@
+import asyncio
 import logging
-import os
-import subprocess
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from pathlib import Path
 import cv2
 import mediapipe as mp
@@ -35,6 +34,8 @@ class FrameProcessor:
     ):
         self.frame_obj = frame_obj
         self.mediapipe_processor = mediapipe_processor
+        # of the last frame with a detected pose
+        self.facing_direction: FacingDirection = "left"
 
     def process_frame(
         self, frame: np.ndarray, timestamp_ms: int
@@ -95,6 +96,7 @@ class FrameProcessor:
         overlay = np.zeros_like(dimmed_frame, dtype=np.uint8)
 
         facing_direction = determine_facing_direction(pose_landmarks)
+        self.facing_direction = facing_direction
         draw_wireframe(overlay, pose_landmarks, facing_direction)
 
         knee_angle = get_knee_angle(pose_landmarks, self.frame_obj, facing_direction)
@@ -161,77 +163,89 @@ class MediaPipeProcessor:
 class VideoProcessor:
     """Main video processing coordinator."""
 
-    def __init__(self, mediapipe_processor: MediaPipeProcessor, gpu_enabled: bool):
+    def __init__(
+        self,
+        mediapipe_processor: MediaPipeProcessor,
+        gpu_enabled: bool,
+        frame_stride: int = 1,
+    ):
         self.mediapipe_processor = mediapipe_processor
         self.gpu_enabled = gpu_enabled
+        self.frame_stride = frame_stride
 
-    def mov_to_mp4(self, input_path: Path, output_path: Path) -> None:
+    async def mov_to_mp4(self, source: str, output_path: Path) -> None:
         """
         Converts a MOV file to MP4 format using FFmpeg.
 
         This method utilizes either GPU-accelerated encoding with NVIDIA NVENC or
         CPU-based encoding with libx264, depending on the GPU availability. It
         constructs the FFmpeg command with appropriate parameters for video quality
-        and encoding speed, executes the conversion, and logs the process.
+        and encoding speed, executes the conversion, and logs the process. FFmpeg
+        runs as an asynchronous subprocess, so the event loop is not blocked while
+        it encodes.
 
         Args:
-            input_path (Path): The path to the input MOV file.
+            source (str): The path or URL of the input MOV file. FFmpeg reads URLs
+                with range requests, so the upload does not need to be downloaded first.
             output_path (Path): The path where the converted MP4 file will be saved.
 
         Raises:
             RuntimeError: If there is an error during the conversion process.
         """
 
-        try:
-            command = ["ffmpeg", "-i", str(input_path)]
-
-            if self.gpu_enabled:
-                # GPU-accelerated encoding using NVIDIA NVENC
-                # fmt: off
-                command.extend(
-                    [
-                        "-c:v", "h264_nvenc",  # Use NVIDIA GPU encoder
-                        "-preset", "p4",  # NVENC preset (p1-p7, p4 is balanced)
-                        "-tune", "hq",  # High quality tuning
-                        "-rc", "vbr",  # Variable bitrate mode
-                        "-cq", "23",  # Quality level (lower = better quality)
-                        "-b:v", "0",  # Let NVENC handle bitrate
-                        "-maxrate", "130M",  # Maximum bitrate constraint
-                        "-bufsize", "130M",  # Buffer size
-                    ]
-                )
-                # fmt: on
-            else:
-                # CPU-based encoding
-                command.extend(["-c:v", "libx264", "-crf", "23", "-preset", "veryfast"])
-
-            command.append(str(output_path))
-
-            result = subprocess.run(command, check=True, capture_output=True, text=True)
-
-            logging.info(
-                f"Successfully converted {input_path} to {output_path}, Result: {result}"
+        # -an: the audio track is not needed for the pose analysis
+        command = ["ffmpeg", "-y", "-i", source, "-an"]
+
+        if self.gpu_enabled:
+            # GPU-accelerated encoding using NVIDIA NVENC
+            # fmt: off
+            command.extend(
+                [
+                    "-c:v", "h264_nvenc",  # Use NVIDIA GPU encoder
+                    "-preset", "p4",  # NVENC preset (p1-p7, p4 is balanced)
+                    "-tune", "hq",  # High quality tuning
+                    "-rc", "vbr",  # Variable bitrate mode
+                    "-cq", "23",  # Quality level (lower = better quality)
+                    "-b:v", "0",  # Let NVENC handle bitrate
+                    "-maxrate", "130M",  # Maximum bitrate constraint
+                    "-bufsize", "130M",  # Buffer size
+                ]
             )
+            # fmt: on
+        else:
+            # CPU-based encoding
+            command.extend(["-c:v", "libx264", "-crf", "23", "-preset", "veryfast"])
 
-            if self.gpu_enabled:
-                logging.info("Conversion completed using GPU acceleration (NVENC)")
-            else:
-                logging.info("Conversion completed using CPU encoding (libx264)")
+        command.append(str(output_path))
 
-        except subprocess.CalledProcessError as e:
-            logging.error(f"FFmpeg conversion error: {e}")
-            logging.error(f"FFmpeg output: {e.stderr}")
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        _, stderr = await process.communicate()
+        if process.returncode != 0:
+            logging.error(f"FFmpeg conversion error: exit code {process.returncode}")
+            # the source is a presigned URL, it must not end up in the logs
+            output = stderr.decode(errors="replace").replace(source, "<source>")
+            logging.error(f"FFmpeg output: {output}")
             raise RuntimeError("Error converting MOV to MP4")
-        except Exception as e:
-            logging.error(f"Unexpected error during conversion: {e}")
-            raise
 
-    def process_video(self, input_path: Path, output_path: Path) -> Result:
+        logging.info(f"Successfully converted to {output_path}")
+
+        if self.gpu_enabled:
+            logging.info("Conversion completed using GPU acceleration (NVENC)")
+        else:
+            logging.info("Conversion completed using CPU encoding (libx264)")
+
+    def process_video(self, input_path: str | Path, output_path: Path) -> Result:
         """
         Process a video file and generate an analyzed output.
 
         Args:
-            input_path (Path): The path to the input video file.
+            input_path (str | Path): The path or URL of the input video file. URLs
+                are streamed, frames are processed while the video is still
+                being transferred.
             output_path (Path): The path where the analyzed output will be saved.
 
         Returns:
@@ -264,7 +278,11 @@ class VideoProcessor:
         self, cap: cv2.VideoCapture, output_path: Path, metadata: VideoMetadata
     ) -> Result:
         """
-        Process all frames in the video and generate analysis results.
+        Process the sampled frames in the video and generate analysis results.
+
+        Only every `frame_stride`-th frame is retrieved, the others are only
+        grabbed and are left out of the analyzed video, which is written at the
+        correspondingly lower frame rate.
 
         Args:
             cap (cv2.VideoCapture): The video capture object to read frames from.
@@ -279,19 +297,31 @@ class VideoProcessor:
         """
         frame_obj = FrameObject(width=metadata.width, height=metadata.height)
         frame_processor = FrameProcessor(frame_obj, self.mediapipe_processor)
-        video_writer = VideoWriter(output_path, metadata)
+        video_writer = VideoWriter(
+            output_path, replace(metadata, fps=metadata.fps / self.frame_stride)
+        )
         frames: List[Frame] = []
-        facing_direction: FacingDirection = "left"
         timestamp_ms = 0
+        grabbed = 0
+        retrieved = 0
 
         try:
             while cap.isOpened():
-                success, frame = cap.read()
-                if not success:
+                # skipped frames are grabbed but never converted to BGR
+                if not cap.grab():
                     logging.info("Reached end of video")
                     break
 
+                grabbed += 1
                 timestamp_ms += int(1000 / metadata.fps)
+                if (grabbed - 1) % self.frame_stride != 0:
+                    continue
+
+                success, frame = cap.retrieve()
+                if not success:
+                    logging.info("Reached end of video")
+                    break
+                retrieved += 1
 
                 process_result = frame_processor.process_frame(frame, timestamp_ms)
 
@@ -302,9 +332,13 @@ class VideoProcessor:
                 result_frame, frame_data = process_result
                 video_writer.write_frame(result_frame)
                 frames.append(frame_data)
-                facing_direction = determine_facing_direction(frame_data.joints)
 
-            video_data = VideoData(frames=frames, facing_direction=facing_direction)
+            logging.info(f"Retrieved {retrieved} of {grabbed} frames")
+
+            # determined while processing each frame, the last one is used
+            video_data = VideoData(
+                frames=frames, facing_direction=frame_processor.facing_direction
+            )
 
             return Result(height=metadata.height, width=metadata.width, data=video_data)
 
@@ -388,40 +422,45 @@ class PhotoProcessor:
         )
         return highest_point, lowest_point
 
-    def process_photo(self, photo) -> Result:
+    def process_photo(self, data: bytes) -> Result:
         """
         Process photo and generate analyzed output.
 
+        The photo is decoded once in memory, the segmenter gets an RGB copy of the
+        decoded pixels.
+
         Args:
-            photo: PhotoFile
+            data (bytes): The encoded photo
+
+        Raises:
+            ValueError: If the photo cannot be decoded.
 
         Returns:
             Result: Processing result containing image dimensions and calculated points
         """
         logging.info("Starting photo processing")
 
-        try:
-            mp_image = mp.Image.create_from_file(str(photo.local_path))
-            frame = cv2.imread(str(photo.local_path))
-
-            metadata = self._get_image_metadata(frame)
+        frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            raise ValueError("Could not decode photo")
+        mp_image = mp.Image(
+            image_format=mp.ImageFormat.SRGB,  # type: ignore
+            data=cv2.cvtColor(frame, cv2.COLOR_BGR2RGB),
+        )
 
-            segmentation_result = self.segmenter.segment(mp_image)
-            mask = segmentation_result.category_mask
+        metadata = self._get_image_metadata(frame)
 
-            mask_normalized = self._process_mask(mask, frame.shape)
+        segmentation_result = self.segmenter.segment(mp_image)
+        mask = segmentation_result.category_mask
 
-            highest_point, lowest_point = self._calculate_points(
-                mask_normalized, metadata["height"]
-            )
+        mask_normalized = self._process_mask(mask, frame.shape)
 
-            return Result(
-                height=metadata["height"],
-                width=metadata["width"],
-                data=(highest_point, lowest_point),
-            )
+        highest_point, lowest_point = self._calculate_points(
+            mask_normalized, metadata["height"]
+        )
 
-        finally:
-            if os.path.exists(photo.local_path):
-                os.remove(photo.local_path)
-                logging.info("Deleted temporary photo")
+        return Result(
+            height=metadata["height"],
+            width=metadata["width"],
+            data=(highest_point, lowest_point),
+        )
@@ -1,9 +1,14 @@
 import logging
+from datetime import timedelta
 from pathlib import Path
 from typing import Optional
 from minio import Minio
 from config import MinioConfig
 
+# the URLs are only read while a video is transcoded or processed, instead of
+# MinIO's default of 7 days
+PRESIGNED_URL_EXPIRY = timedelta(hours=1)
+
 
 class StorageClient:
     """
@@ -33,26 +38,50 @@ class StorageClient:
             self.client.make_bucket(self.config.bucket_name)
             logging.info(f"Created bucket '{self.config.bucket_name}'")
 
-    def download_file(self, object_path: str, local_path: Path) -> None:
+    def download_bytes(self, object_path: str) -> bytes:
         """
-        Downloads a file from the storage bucket to a specified local path.
+        Downloads a file from the storage bucket into memory.
 
         Args:
             object_path (str): The path of the file in the storage bucket.
-            local_path (Path): The local file path where the file will be saved.
+
+        Returns:
+            bytes: The content of the file.
 
         Raises:
             Exception: If an error occurs during the download process.
         """
+        data = None
         try:
-            print(object_path)
             data = self.client.get_object(self.config.bucket_name, object_path)
-            with open(local_path, "wb") as file_data:
-                for d in data.stream(32 * 1024):
-                    file_data.write(d)
+            return data.read()
         except Exception as e:
             logging.error(f"Error downloading file {object_path}: {str(e)}")
             raise
+        finally:
+            # return the connection to the pool instead of leaking it
+            if data is not None:
+                data.close()
+                data.release_conn()
+
+    def presigned_url(
+        self, object_path: str, expires: timedelta = PRESIGNED_URL_EXPIRY
+    ) -> str:
+        """
+        Creates a temporary URL to read an object from the storage bucket.
+
+        The URL grants read access to anyone holding it, it must not be logged.
+
+        Args:
+            object_path (str): The path of the file in the storage bucket.
+            expires (timedelta): How long the URL stays valid.
+
+        Returns:
+            str: A presigned GET URL for the object.
+        """
+        return self.client.presigned_get_object(
+            self.config.bucket_name, object_path, expires=expires
+        )
 
     def upload_file(
         self, object_path: str, local_path: Path, content_type: Optional[str] = None